@@ -0,0 +1,151 @@
+"""
+Offline end-to-end benchmark: runs the extraction against a local fake Confluence v2 API, with in-memory GCS and BigQuery,
+for synthetic tenants of increasing size, and reports records/s, bytes/s, peak RSS and per-stage latencies.
+
+    python benchmarks/bench_pipeline.py --records 1000 10000 100000 --latency 0.02 --throttle-rate 0.01
+    python benchmarks/bench_pipeline.py --records 100000 --env EXTRACTION_MODE=stream --env BQ_LOAD_MODE=gcs
+
+Each tenant runs in its own process, so peak RSS and the module state are measured from a clean start.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app"))
+
+from fakes import FakeBigQueryClient, FakeConfluence, FakeStorageClient
+import main
+
+
+def run_extraction(pipelines: list[str] | None) -> dict[str, Any]:
+    """
+    Run the extraction once, with the GCP clients replaced by in-memory fakes.
+    Args:
+        pipelines: the pipelines to run, all of them when None.
+    Returns:
+        the wall time, peak RSS, stage timings and the metrics collected by the extraction.
+    """
+    storage_client = FakeStorageClient()
+    bq_client = FakeBigQueryClient(storage_client)
+    # the clients are created on first use, so they are replaced for the whole run
+    with mock.patch("google.cloud.bigquery.Client", return_value=bq_client), \
+            mock.patch("google.cloud.storage.Client", return_value=storage_client):
+        started = time.perf_counter()
+        timings = main.get_data(pipelines)
+        elapsed = time.perf_counter() - started
+
+    stages: dict[str, float] = {}
+    for pipeline_timings in timings.values():
+        for stage, seconds in pipeline_timings.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return {
+        "seconds": elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "pipelines": timings,
+        "stages": stages,
+        "spans": main.run_metrics.summary(),
+        # rows appended through BQ_SINK=memory never go through a load job
+        "rows_loaded": sum(bq_client.rows.values()) + sum(len(batch) for batches in main.InMemorySink.batches.values() for batch in batches),
+        "gcs_uploaded_bytes": sum(bucket.uploaded_bytes for bucket in storage_client.buckets.values()),
+        "api": main.api_metrics(),
+        "gcs_uploads": main.gcs_writer.stats(),
+    }
+
+
+def run_tenant(records: int, args: argparse.Namespace) -> dict[str, Any]:
+    """
+    Serve a synthetic tenant and run the extraction against it in a child process.
+    Args:
+        records: the number of records of the tenant.
+        args: the command line arguments.
+    Returns:
+        the results of the run, with the records and bytes served by the fake API.
+    """
+    fake = FakeConfluence(records, body_size=args.body_size, attachment_ratio=args.attachment_ratio,
+                          attachment_size=args.attachment_size, latency=args.latency, throttle_rate=args.throttle_rate,
+                          retry_after=args.retry_after)
+    with fake, tempfile.TemporaryDirectory(prefix="confluence_bench_") as workdir:
+        env = dict(os.environ)
+        env.update({
+            "BASE_URL": fake.base_url,
+            "EMAIL": "bench@example.com",
+            "API_TOKEN": "bench",
+            "PROJECT_NAME": "bench",
+            "DATASET": "bench",
+            "GCP_STORAGE_BUCKET": "bench",
+            "GCP_LOGGING_SERVICE_NAME": "confluence-bench",
+            "TMP_DOWNLOADS_FOLDER": workdir,
+            "API_MAX_REQUESTS_PER_SECOND": str(args.max_rps),
+            "CHECKPOINT_LOCATION": "",
+            "ATTACHMENT_INDEX_LOCATION": os.path.join(workdir, "attachment_index.json"),
+        })
+        env.update(dict(item.split("=", 1) for item in args.env))
+        command = [sys.executable, os.path.abspath(__file__), "--child"] + [arg for name in args.pipelines for arg in ("--pipeline", name)]
+        child = subprocess.run(command, env=env, capture_output=True, text=True)
+        if child.returncode != 0:
+            raise RuntimeError(f"benchmark run for {records} records failed:\n{child.stderr}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+
+    result["records"] = sum(fake.counts.values())
+    result["served"] = dict(fake.stats)
+    result["records_per_second"] = result["records"] / result["seconds"]
+    result["bytes_per_second"] = (fake.stats["bytes"] + result["gcs_uploaded_bytes"]) / result["seconds"]
+    return result
+
+
+def print_summary(records: int, result: dict[str, Any]) -> None:
+    print(f"\n{records:,} records in {result['seconds']:.2f}s")
+    print(f"  throughput   {result['records_per_second']:>12,.0f} records/s  {result['bytes_per_second'] / 2**20:>10,.1f} MiB/s")
+    print(f"  peak RSS     {result['peak_rss_mb']:>12,.1f} MiB")
+    print(f"  requests     {result['served']['requests']:>12,} ({result['served']['throttled']:,} throttled, "
+          f"{result['served']['downloads']:,} downloads)")
+    print(f"  rows loaded  {result['rows_loaded']:>12,}")
+    print(f"  uploads      p50 {result['gcs_uploads']['p50_seconds'] * 1000:.1f}ms  p95 {result['gcs_uploads']['p95_seconds'] * 1000:.1f}ms")
+    for stage, seconds in sorted(result["stages"].items()):
+        print(f"  {stage:<12} {seconds:>12.2f}s (summed over pipelines)")
+    spans: dict[str, list[dict[str, Any]]] = {}
+    for entry in result["spans"]:
+        spans.setdefault(entry["stage"], []).append(entry)
+    for stage, entries in spans.items():
+        p95 = max(entry["p95_seconds"] for entry in entries)
+        print(f"  {stage:<20} {sum(entry['count'] for entry in entries):>8,} spans  worst p95 {p95 * 1000:>9.1f}ms  "
+              f"{sum(entry['retries'] for entry in entries):,} retries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="tenant sizes to run, e.g. 1000 100000 1000000")
+    parser.add_argument("--body-size", type=int, default=2048, help="characters in each page and blog post body")
+    parser.add_argument("--attachment-ratio", type=float, default=0.01, help="share of the records that are attachments")
+    parser.add_argument("--attachment-size", type=int, default=64 * 1024, help="bytes in each attachment")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response of the fake API")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of page requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After of the 429 responses, in seconds")
+    parser.add_argument("--max-rps", type=float, default=1000, help="API_MAX_REQUESTS_PER_SECOND of the extraction")
+    parser.add_argument("--pipeline", dest="pipelines", action="append", default=[], help="pipeline to run, repeatable, all by default")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE setting of the extraction, repeatable")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_extraction(args.pipelines or None)))
+        sys.exit(0)
+
+    results = {}
+    for records in args.records:
+        results[records] = run_tenant(records, args)
+        print_summary(records, results[records])
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
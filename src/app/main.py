@@ -1,32 +1,191 @@
+import abc
+import argparse
+import asyncio
 import concurrent.futures
+import contextlib
+import copy
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import gzip
+import hashlib
+import io
 import json
 import logging
+import math
 import mimetypes
+import multiprocessing
 import os
+import queue
+import random
 import shutil
-from typing import Any
-
+import sqlite3
+import threading
+import time
+import zlib
+import uuid
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Iterable, Iterator
+from urllib.parse import urlencode, urlparse
+
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery, storage
-import google.cloud.logging
-from google.cloud.logging.handlers import CloudLoggingHandler
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
+if TYPE_CHECKING:
+    import aiohttp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 jira_api_url          = os.getenv("BASE_URL")
 project_name          = os.getenv("PROJECT_NAME")
 auth_token            = HTTPBasicAuth(os.getenv("EMAIL"), os.getenv("API_TOKEN"))
 dataset_name          = os.getenv("DATASET")
 gcs_bucket_name       = os.getenv("GCP_STORAGE_BUCKET")
-bq_client             = bigquery.Client(project=project_name)
-gcs_storage_client    = storage.Client(project=project_name)
-gcs_bucket            = gcs_storage_client.bucket(gcs_bucket_name)
 
+# the folders are created by create_output_folders when a run starts
 downloads_folder = os.getenv("TMP_DOWNLOADS_FOLDER")
-os.makedirs(downloads_folder, exist_ok=True)
 tmp_outpath = f"{downloads_folder}/{datetime.now().strftime('%Y%m%d')}"
-os.makedirs(tmp_outpath, exist_ok=True)
+
+# Number of resource pipelines (fetch -> clean -> write -> load) allowed to run at the same time.
+MAX_CONCURRENT_PIPELINES = int(os.getenv("MAX_CONCURRENT_PIPELINES", "3"))
+# Number of requests allowed in flight against a single host, shared by all pipelines.
+MAX_REQUESTS_PER_HOST = int(os.getenv("MAX_REQUESTS_PER_HOST", "4"))
+# "batch" collects a whole resource before cleaning and writing it, "stream" cleans and appends every page as it arrives.
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "batch")
+# Number of hosts the shared HTTP session keeps a connection pool for.
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+# Number of kept-alive connections per host, at least ATTACHMENT_DOWNLOAD_WORKERS.
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+# "sync" runs the pipelines on threads with requests, "async" runs them as coroutines on a single event loop with aiohttp.
+# The async engine always streams pages, downloads attachments to disk and only checkpoints the page cursors of staging parts.
+EXTRACTION_ENGINE = os.getenv("EXTRACTION_ENGINE", "sync")
+# Number of Confluence requests (pages and downloads) the async engine keeps in flight.
+ASYNC_MAX_REQUESTS = int(os.getenv("ASYNC_MAX_REQUESTS", "100"))
+# Number of GCS uploads the async engine runs at the same time.
+ASYNC_MAX_UPLOADS = int(os.getenv("ASYNC_MAX_UPLOADS", "16"))
+# Number of threads downloading attachments from Confluence.
+ATTACHMENT_DOWNLOAD_WORKERS = int(os.getenv("ATTACHMENT_DOWNLOAD_WORKERS", "8"))
+# Number of threads uploading downloaded attachments to GCS.
+ATTACHMENT_UPLOAD_WORKERS = int(os.getenv("ATTACHMENT_UPLOAD_WORKERS", "4"))
+# Number of attachments waiting to be downloaded, and separately to be uploaded, before the stage feeding them blocks.
+ATTACHMENT_QUEUE_SIZE = int(os.getenv("ATTACHMENT_QUEUE_SIZE", "32"))
+# "disk" downloads attachments to TMP_DOWNLOADS_FOLDER before uploading them, "stream" pipes the download straight into GCS.
+ATTACHMENT_TRANSFER_MODE = os.getenv("ATTACHMENT_TRANSFER_MODE", "disk")
+# Size of the chunks sent by streamed GCS uploads, must be a multiple of 256 KB.
+GCS_UPLOAD_CHUNK_SIZE = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Size of the chunks read from Confluence when streaming an attachment.
+STREAM_READ_CHUNK_SIZE = 1024 * 1024
+# "process" cleans records in worker processes, which the GIL doesn't serialize, "thread" on threads of this process.
+CLEAN_WORKER_BACKEND = os.getenv("CLEAN_WORKER_BACKEND", "process")
+# Number of workers cleaning records, 0 to use every CPU available to the container.
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "0"))
+# Number of records handed to a cleaning worker at a time, smaller batches are cleaned without the pool.
+CLEAN_CHUNK_SIZE = int(os.getenv("CLEAN_CHUNK_SIZE", "1000"))
+
+# Where the index of attachments already uploaded to GCS is kept, a local path or a gs://bucket/object url.
+ATTACHMENT_INDEX_LOCATION = os.getenv("ATTACHMENT_INDEX_LOCATION", f"gs://{gcs_bucket_name}/confluence_state/attachment_index.json")
+# Number of attachments remembered by the index, the least recently seen are dropped first.
+ATTACHMENT_INDEX_MAX_ENTRIES = int(os.getenv("ATTACHMENT_INDEX_MAX_ENTRIES", "200000"))
+# "inline" keeps page and blog post bodies in their rows, "gcs" uploads each distinct body to GCS gzip-compressed,
+# named after its sha256, and only keeps its hash, size and gs:// uri in the row.
+BODY_STORAGE = os.getenv("BODY_STORAGE", "inline")
+# GCS directory of the bodies uploaded when BODY_STORAGE=gcs.
+BODY_GCS_DIRECTORY = os.getenv("BODY_GCS_DIRECTORY", "confluence_bodies/")
+# Where the index of bodies already uploaded to GCS is kept, a local path or a gs://bucket/object url.
+BODY_INDEX_LOCATION = os.getenv("BODY_INDEX_LOCATION", f"gs://{gcs_bucket_name}/confluence_state/body_index.json")
+# Number of body hashes remembered by the index, the least recently seen are dropped first.
+BODY_INDEX_MAX_ENTRIES = int(os.getenv("BODY_INDEX_MAX_ENTRIES", "200000"))
+# Number of threads compressing and uploading bodies.
+BODY_UPLOAD_WORKERS = int(os.getenv("BODY_UPLOAD_WORKERS", "8"))
+# Format of the files loaded into BigQuery: "jsonl", "parquet" (needs pyarrow) or "avro".
+STAGING_FORMAT = os.getenv("STAGING_FORMAT", "jsonl")
+# Number of records buffered into each Parquet row group or Avro block.
+STAGING_ROW_GROUP_SIZE = int(os.getenv("STAGING_ROW_GROUP_SIZE", "10000"))
+# Size in bytes at which a staging part is closed and handed to the loader while the next one is written, in stream mode.
+# 0 writes a single staging file per resource, loaded once all its pages are written.
+STAGING_PART_SIZE = int(os.getenv("STAGING_PART_SIZE", "0"))
+# Compression of JSONL staging parts, "gzip" or "none". BigQuery doesn't read zstd-compressed JSON.
+STAGING_PART_COMPRESSION = os.getenv("STAGING_PART_COMPRESSION", "gzip")
+# Size of the chunks of encoded records buffered in memory before being compressed into a gzip staging part.
+STAGING_CHUNK_SIZE = 1024 * 1024
+# Compression codec of Parquet staging files, one of those BigQuery reads: snappy, gzip or zstd.
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "snappy")
+# "file" uploads each staging file with its load job and waits for it, "gcs" stages the files in GCS
+# and waits for all the load jobs of the run together.
+BQ_LOAD_MODE = os.getenv("BQ_LOAD_MODE", "file")
+# GCS directory the staging files are uploaded to when BQ_LOAD_MODE=gcs.
+BQ_STAGING_DIRECTORY = os.getenv("BQ_STAGING_DIRECTORY", "confluence_staging/")
+# "shard" appends each run to a table_YYYYMMDD table, "merge" loads into a staging table and merges it into a single table
+# per resource holding the latest version of each id, partitioned by extraction date and clustered by id.
+BQ_WRITE_MODE = os.getenv("BQ_WRITE_MODE", "shard")
+# Sink writing cleaned records straight to the day's table as pages arrive, instead of loading staging files:
+# empty to disable, "storage-write" for the BigQuery Storage Write API or "memory" for the in-memory fake.
+BQ_SINK = os.getenv("BQ_SINK", "")
+# Number of records sent in each append to the sink.
+BQ_SINK_BATCH_SIZE = int(os.getenv("BQ_SINK_BATCH_SIZE", "500"))
+# Where the summary of the run's metrics is written as JSON, a local path or a gs://bucket/object url. Empty disables it.
+METRICS_JSON_LOCATION = os.getenv("METRICS_JSON_LOCATION", "")
+# Local path of a Prometheus text file the run's metrics are written to, e.g. for the node_exporter textfile collector.
+METRICS_PROMETHEUS_FILE = os.getenv("METRICS_PROMETHEUS_FILE", "")
+# Local path of the SQLite cache of the record versions already loaded and of the ETag/Last-Modified and body of the
+# API pages, so records that did not change since the last run are skipped. Empty disables it.
+RESPONSE_CACHE_LOCATION = os.getenv("RESPONSE_CACHE_LOCATION", "")
+# Number of records, and separately of pages, remembered by the cache, the least recently used are dropped first.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000000"))
+# Where the sync checkpoints of each resource type are kept, a local path or a gs://bucket/object url. Empty disables them.
+CHECKPOINT_LOCATION = os.getenv("CHECKPOINT_LOCATION", f"gs://{gcs_bucket_name}/confluence_state/checkpoints.json")
+
+# Common file signatures
+FILE_SIGNATURES = {
+    b"%PDF": "PDF file",
+    b"\xFF\xD8\xFF": "JPEG image",
+    b"\x89PNG\r\n\x1A\n": "PNG image",
+    b"PK\x03\x04": "ZIP archive",
+    b"GIF87a": "GIF image",
+    b"GIF89a": "GIF image",
+}
+
+# "index" fills the space key and page or blog post title of the records referencing them from an index of the spaces,
+# pages and blog posts extracted in the same run, "off" loads every pipeline without waiting for the ones it references.
+REFERENCE_ENRICHMENT = os.getenv("REFERENCE_ENRICHMENT", "index")
+# "serial" follows one cursor chain per resource type, "space" lists the spaces first and pages through
+# the per-space endpoints of pages and blog posts concurrently.
+PAGINATION_MODE = os.getenv("PAGINATION_MODE", "serial")
+# Number of spaces paged through at the same time in space mode, requests stay bounded by MAX_REQUESTS_PER_HOST.
+SPACE_FANOUT_WORKERS = int(os.getenv("SPACE_FANOUT_WORKERS", "8"))
+# Number of attempts for a single Confluence page request before the pagination fails.
+API_MAX_ATTEMPTS = int(os.getenv("API_MAX_ATTEMPTS", "6"))
+# Highest rate of Confluence page requests per second per host, lowered automatically while the API throttles.
+API_MAX_REQUESTS_PER_SECOND = float(os.getenv("API_MAX_REQUESTS_PER_SECOND", "10"))
+
+_host_request_slots: dict[str, threading.BoundedSemaphore] = {}
+_host_request_slots_lock = threading.Lock()
+
+_host_rate_limiters: dict[str, "AdaptiveRateLimiter"] = {}
+_host_rate_limiters_lock = threading.Lock()
+
+_api_metrics: dict[str, dict[str, float]] = {}
+_api_metrics_lock = threading.Lock()
+
+_http_session: requests.Session | None = None
+_http_session_lock = threading.Lock()
+_bq_client: bigquery.Client | None = None
+_gcs_storage_client: storage.Client | None = None
+_gcp_clients_lock = threading.Lock()
+
+# serializes picking a free file name in the downloads folder between download threads
+_save_path_lock = threading.Lock()
+# marks the end of the jobs put on an attachment pipeline queue, or of the pages of a space
+_QUEUE_DONE = object()
+_space_ids: list[str] | None = None
+_space_ids_lock = threading.Lock()
+# created by each async run, an asyncio lock is bound to the event loop it is first awaited on
+_async_space_ids_lock: asyncio.Lock | None = None
 
 RESOURCE_TYPES = {
     "spaces": "{url}spaces",
@@ -38,6 +197,13 @@ RESOURCE_TYPES = {
     "attachments": "{url}attachments",
 }
 
+# Per-space endpoints of the resource types paged through space by space when PAGINATION_MODE=space.
+# Footer comments, inline comments, tasks and attachments have no per-space endpoint in the v2 API.
+SPACE_RESOURCE_TYPES = {
+    "pages": "{url}spaces/{space_id}/pages",
+    "blogposts": "{url}spaces/{space_id}/blogposts",
+}
+
 spaces_table_schema = [
     bigquery.SchemaField("spaceOwnerId", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("createdAt", "STRING", mode="NULLABLE"),
@@ -65,6 +231,10 @@ comments_table_schema = [
     bigquery.SchemaField("parentCommentId", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("resolutionLastModifierId", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("resolutionLastModifiedAt", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceId", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceKey", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("pageTitle", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("blogPostTitle", "STRING", mode="NULLABLE"),
 ]
 
 attachments_table_schema = [
@@ -84,6 +254,10 @@ attachments_table_schema = [
     bigquery.SchemaField("fileSize", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("webuiLink", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("gcsLink", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceId", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceKey", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("pageTitle", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("blogPostTitle", "STRING", mode="NULLABLE"),
 ]
 
 blogposts_table_schema = [
@@ -91,9 +265,13 @@ blogposts_table_schema = [
     bigquery.SchemaField("status", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("spaceId", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceKey", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("createdAt", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("authorId", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("body", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("bodySha256", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("bodySize", "INTEGER", mode="NULLABLE"),
+    bigquery.SchemaField("bodyUri", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("version", "STRING", mode="NULLABLE"),
 ]
 
@@ -112,6 +290,9 @@ tasks_table_schema = [
     bigquery.SchemaField("updatedAt", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("dueAt", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("completedAt", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceKey", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("pageTitle", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("blogPostTitle", "STRING", mode="NULLABLE"),
 ]
 
 pages_table_schema = [
@@ -119,6 +300,7 @@ pages_table_schema = [
     bigquery.SchemaField("status", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("spaceId", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("spaceKey", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("parentId", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("parentType", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("position", "STRING", mode="NULLABLE"),
@@ -129,26 +311,346 @@ pages_table_schema = [
     bigquery.SchemaField("createdAt", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("version", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("body", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("bodySha256", "STRING", mode="NULLABLE"),
+    bigquery.SchemaField("bodySize", "INTEGER", mode="NULLABLE"),
+    bigquery.SchemaField("bodyUri", "STRING", mode="NULLABLE"),
     bigquery.SchemaField("sourceTemplateEntityId", "STRING", mode="NULLABLE"),
 ]
 
+# Each pipeline fetches one or more resource types and loads them into a single table named after the pipeline.
+# Its parents are the pipelines whose records it references, see ReferenceIndex.
+RESOURCE_PIPELINES: dict[str, dict[str, Any]] = {
+    "spaces": {"resources": ["spaces"], "schema": spaces_table_schema, "category": "data", "parents": []},
+    "blogposts": {"resources": ["blogposts"], "schema": blogposts_table_schema, "category": "data", "parents": ["spaces"]},
+    "tasks": {"resources": ["tasks"], "schema": tasks_table_schema, "category": "data", "parents": ["spaces", "pages", "blogposts"]},
+    "pages": {"resources": ["pages"], "schema": pages_table_schema, "category": "data", "parents": ["spaces"]},
+    "comments": {"resources": ["footer-comments", "inline-comments"], "schema": comments_table_schema, "category": "data",
+                 "parents": ["spaces", "pages", "blogposts"]},
+    "attachments": {"resources": ["attachments"], "schema": attachments_table_schema, "category": "attachments",
+                    "parents": ["spaces", "pages", "blogposts"]},
+}
+
+# handlers are attached by configure_cloud_logging when the script runs, importing the module stays silent
+LOGGER = logging.getLogger(os.getenv("GCP_LOGGING_SERVICE_NAME"))
+
 def configure_cloud_logging() -> logging.Logger:
-    """Create a cloud logging handler"""
+    """Attach the cloud logging and debug file handlers to the logger"""
+    # imported here so that importing the module doesn't pay for the logging client library
+    import google.cloud.logging
+    from google.cloud.logging.handlers import CloudLoggingHandler
+
     client = google.cloud.logging.Client.from_service_account_json(
         os.getenv("GOOGLE_APPLICATION_CREDENTIALS"), project=os.getenv("PROJECT_NAME"))
     client.setup_logging(log_level=logging.INFO)
     cloud_handler = CloudLoggingHandler(client, name=os.getenv("GCP_LOGGING_SERVICE_NAME"))
+    create_output_folders()
     file_handler = logging.FileHandler(f"{tmp_outpath}/debug_{datetime.now().strftime("%Y%m%d")}.log", mode="w", encoding="utf-8")
     formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(lineno)d - %(message)s")
     file_handler.setFormatter(formatter)
 
-    logger = logging.getLogger(os.getenv("GCP_LOGGING_SERVICE_NAME"))
-    logger.addHandler(cloud_handler)
-    logger.addHandler(file_handler)
+    LOGGER.addHandler(cloud_handler)
+    LOGGER.addHandler(file_handler)
+
+    return LOGGER
+
+def create_output_folders() -> None:
+    """Create the temporary output folder of the day, where staging files, downloads and the debug log are written"""
+    os.makedirs(tmp_outpath, exist_ok=True)
+
+def available_cpus() -> int:
+    """
+    Count the CPUs this process may run on, capped by the CPU quota of its container (cgroup v2 or v1).
+    Returns:
+        the number of CPUs, at least 1.
+    """
+    count = getattr(os, "process_cpu_count", os.cpu_count)() or 1
+    quotas = (("/sys/fs/cgroup/cpu.max", None), ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "/sys/fs/cgroup/cpu/cpu.cfs_period_us"))
+    for quota_path, period_path in quotas:
+        try:
+            with open(quota_path, "r", encoding="utf-8") as fp:
+                values = fp.read().split()
+            if period_path:
+                with open(period_path, "r", encoding="utf-8") as fp:
+                    values.append(fp.read().strip())
+        except OSError:
+            continue
+        if values[0] not in ("max", "-1"):
+            count = min(count, max(1, math.ceil(int(values[0]) / int(values[1]))))
+        break
+    return count
+
+class WorkerPool:
+    """
+    A pool of workers running a function over chunks of items.
+    The "process" backend runs CPU-bound functions in forked worker processes, so they are not serialized by the GIL,
+    the "thread" backend runs I/O-bound functions on threads of this process.
+    """
+    def __init__(self, backend: str, max_workers: int):
+        self.backend = backend
+        self.max_workers = max_workers
+        if backend == "process":
+            # forked workers inherit the schemas and compiled transformers instead of importing the module again
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            self._executor: concurrent.futures.Executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> concurrent.futures.Future:
+        """
+        Run a function on a worker.
+        Args:
+            fn: the function, a module-level function for the process backend.
+            args: its arguments, pickled for the process backend.
+        Returns:
+            the future of its result.
+        """
+        return self._executor.submit(fn, *args)
+
+    def map_chunks(self, fn: Callable[..., list[Any]], items: list[Any], chunk_size: int, *args: Any) -> Iterator[list[Any]]:
+        """
+        Run fn(*args, chunk) over consecutive chunks of the items, all chunks in flight at the same time.
+        Args:
+            fn: the function, returning a list of results for each chunk.
+            items: the items to split in chunks, only references are copied on the thread backend.
+            chunk_size: the number of items in each chunk.
+            args: the first arguments of fn, sent with every chunk.
+        Yields:
+            the result of each chunk, in the order of the items.
+        """
+        futures = [self.submit(fn, *args, items[start:start + chunk_size]) for start in range(0, len(items), chunk_size)]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self) -> None:
+        """Wait for the running functions and stop the workers."""
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
+
+_cleaning_pool: WorkerPool | None = None
+_cleaning_pool_lock = threading.Lock()
+
+def cleaning_pool() -> WorkerPool | None:
+    """
+    Get the pool shared by all pipelines to clean records, started on first use.
+    Returns:
+        the pool, or None when a single worker is available and records are cleaned in the calling thread.
+    """
+    global _cleaning_pool
+    workers = CLEAN_WORKERS or available_cpus()
+    if workers < 2:
+        return None
+    with _cleaning_pool_lock:
+        if _cleaning_pool is None:
+            _cleaning_pool = WorkerPool(CLEAN_WORKER_BACKEND, workers)
+            LOGGER.info("[cleaning_pool] Started %d %s workers", workers, CLEAN_WORKER_BACKEND)
+        return _cleaning_pool
+
+def shutdown_cleaning_pool() -> None:
+    """Stop the workers of the cleaning pool, if it was started."""
+    global _cleaning_pool
+    with _cleaning_pool_lock:
+        if _cleaning_pool is not None:
+            _cleaning_pool.shutdown()
+            _cleaning_pool = None
+
+def host_request_slot(url: str) -> threading.BoundedSemaphore:
+    """
+    Get the semaphore limiting the number of requests in flight against the host of a url.
+    Args:
+        url: the url about to be requested.
+    Returns:
+        the semaphore shared by all requests to the same host.
+    """
+    host = urlparse(url).netloc
+    with _host_request_slots_lock:
+        if host not in _host_request_slots:
+            _host_request_slots[host] = threading.BoundedSemaphore(MAX_REQUESTS_PER_HOST)
+        return _host_request_slots[host]
+
+class AdaptiveRateLimiter:
+    """
+    Spaces out requests to a host. The rate is halved every time the host throttles a request and
+    creeps back up with every successful one, and no request is let through before a Retry-After expires.
+    """
+    def __init__(self, max_rate: float, min_rate: float = 0.5):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Reserve the next request slot.
+        Returns:
+            the number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            return slot - now
+
+    def acquire(self) -> None:
+        """Block until the next request slot."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_success(self) -> None:
+        """Raise the rate a little after a request that was not throttled."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttle(self, retry_after: float | None) -> None:
+        """
+        Halve the rate after a throttled request and hold every request until the Retry-After expires.
+        Args:
+            retry_after: the number of seconds the host asked to wait, if it said.
+        """
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            if retry_after:
+                self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+
+def host_rate_limiter(url: str) -> AdaptiveRateLimiter:
+    """
+    Get the rate limiter shared by all page requests to the host of a url.
+    Args:
+        url: the url about to be requested.
+    Returns:
+        the rate limiter of the host.
+    """
+    host = urlparse(url).netloc
+    with _host_rate_limiters_lock:
+        if host not in _host_rate_limiters:
+            _host_rate_limiters[host] = AdaptiveRateLimiter(API_MAX_REQUESTS_PER_SECOND)
+        return _host_rate_limiters[host]
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header.
+    Args:
+        value: the header value, a number of seconds or an HTTP date.
+    Returns:
+        the number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now().astimezone()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt: int, retry_after: float | None) -> float:
+    """
+    Get how long to wait before retrying a request.
+    Args:
+        attempt: the number of the attempt that failed, starting at 1.
+        retry_after: the number of seconds the host asked to wait, if it said.
+    Returns:
+        the Retry-After if given, otherwise a random exponential backoff between 1 and 60 seconds.
+    """
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(1, min(60, 2 ** attempt))
+
+def record_api_metrics(resource_type: str, **counts: float) -> None:
+    """
+    Add to the request counters of a resource type.
+    Args:
+        resource_type: the type of resource the request was for.
+        counts: the amounts to add, keyed by counter name.
+    """
+    with _api_metrics_lock:
+        metrics = _api_metrics.setdefault(resource_type, {"requests": 0, "retries": 0, "throttled": 0, "not_modified": 0, "retry_wait_seconds": 0.0})
+        for key, value in counts.items():
+            metrics[key] += value
+
+def api_metrics() -> dict[str, dict[str, float]]:
+    """
+    Get the request counters of every resource type.
+    Returns:
+        the requests, retries, throttled and not modified responses and seconds spent waiting to retry, keyed by resource type.
+    """
+    with _api_metrics_lock:
+        return {resource_type: dict(metrics) for resource_type, metrics in _api_metrics.items()}
+
+def get_bq_client() -> bigquery.Client:
+    """
+    Get the BigQuery client shared by all pipelines, creating it on first use.
+    Returns:
+        the client of the PROJECT_NAME project.
+    """
+    global _bq_client
+    with _gcp_clients_lock:
+        if _bq_client is None:
+            _bq_client = bigquery.Client(project=project_name)
+        return _bq_client
+
+def get_gcs_storage_client() -> storage.Client:
+    """
+    Get the Cloud Storage client shared by all pipelines, creating it on first use.
+    Returns:
+        the client of the PROJECT_NAME project.
+    """
+    global _gcs_storage_client
+    with _gcp_clients_lock:
+        if _gcs_storage_client is None:
+            _gcs_storage_client = storage.Client(project=project_name)
+        return _gcs_storage_client
 
-    return logger
+def get_gcs_bucket() -> storage.Bucket:
+    """
+    Get the GCP_STORAGE_BUCKET bucket, without checking that it exists.
+    Returns:
+        the bucket.
+    """
+    return gcs_writer.bucket
 
-LOGGER = configure_cloud_logging()
+def get_http_session() -> requests.Session:
+    """
+    Get the HTTP session shared by all Confluence requests, creating it on first use.
+    The session keeps connections alive in a pool per host so pages and downloads reuse them
+    instead of paying a new TCP and TLS handshake on every request.
+    Returns:
+        the shared session, authenticated against Confluence.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            # pool_block makes threads wait for a free connection instead of opening throwaway ones
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.auth = auth_token
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            _http_session = session
+        return _http_session
+
+def http_connection_stats() -> dict[str, int]:
+    """
+    Count the requests sent and connections opened by the shared HTTP session.
+    Returns:
+        the number of requests, of connections opened and of requests that reused an open connection.
+    """
+    sent = opened = 0
+    for adapter in set(get_http_session().adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            sent += pools[key].num_requests
+            opened += pools[key].num_connections
+    return {"requests": sent, "connections_opened": opened, "connections_reused": sent - opened}
 
 def directory_exists(directory_name: str) -> bool:
     """
@@ -162,7 +664,7 @@ def directory_exists(directory_name: str) -> bool:
     """
     if directory_name[-1] != "/":
         directory_name += "/"
-    blobs = list(gcs_bucket.list_blobs(prefix=directory_name, max_results=1))
+    blobs = list(get_gcs_bucket().list_blobs(prefix=directory_name, max_results=1))
 
     return len(blobs) > 0
 
@@ -179,7 +681,7 @@ def gcs_add_directory(directory_name: str) -> bool:
         if directory_name[-1] != "/":
             directory_name = directory_name + "/"
 
-        blob = gcs_bucket.blob(directory_name)
+        blob = get_gcs_bucket().blob(directory_name)
         blob.upload_from_string("", content_type="application/x-www-form-urlencoded:charset=UTF-8")
     return True
 
@@ -196,30 +698,894 @@ def gcs_check_and_create_bucket(bucket: storage.Bucket, bucket_name: str) -> boo
         return True
     else:
         try:
-            bucket = gcs_storage_client.create_bucket(bucket_name)
+            bucket = get_gcs_storage_client().create_bucket(bucket_name)
         except Exception:
             return False
     return True
 
-def gcs_add_file(file_path: str, directory_name: str = "confluence_attachments/") -> str:
+def gcs_add_file(file_path: str, directory_name: str = "confluence_attachments/", object_name: str | None = None) -> str:
     """
     Add a file to the cloud storage bucket.
     Args:
         file_path: local file path to the file to add to GCS
         directory_name: the name of the GCS directory to upload the file to.
+        object_name: the name of the file in the directory, defaults to the name of the local file.
     Returns:
         the public url of the image
     """
-    gcs_check_and_create_bucket(gcs_bucket, gcs_bucket_name)
+    return gcs_writer.upload_file(file_path, directory_name, object_name)
 
-    if directory_name[-1] != "/":
-        directory_name = directory_name + "/"
+def gcs_new_blob(filename: str, directory_name: str = "confluence_attachments/", chunk_size: int | None = None) -> storage.Blob:
+    """
+    Make sure the bucket and directory exist and create a blob for a file in the directory.
+    Args:
+        filename: the name of the file in GCS.
+        directory_name: the name of the GCS directory holding the file.
+        chunk_size: the size of the chunks of a resumable upload, None for a single request upload.
+    Returns:
+        the blob the file can be uploaded to.
+    """
+    return gcs_writer.new_blob(filename, directory_name, chunk_size)
+
+def percentile(values: list[float], pct: float) -> float:
+    """
+    Get a percentile of a list of values using the nearest-rank method.
+    Args:
+        values: the values, in any order.
+        pct: the percentile to get, between 0 and 100.
+    Returns:
+        the percentile, or 0.0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+class RunMetrics:
+    """
+    Collects timing spans around the stages of a run (API pages, downloads, uploads, writes, load jobs...),
+    with the bytes, records and retries each of them handled, and aggregates them per stage and resource.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def observe(self, stage: str, seconds: float, resource: str = "", error: bool = False, **counts: int) -> None:
+        """
+        Record one occurrence of a stage.
+        Args:
+            stage: the name of the stage.
+            seconds: how long it took.
+            resource: the resource type or pipeline it worked on, if any.
+            error: whether it failed.
+            counts: the bytes, records and retries it handled.
+        """
+        with self._lock:
+            entry = self._stages.setdefault((stage, resource), {"latencies": [], "errors": 0, "bytes": 0, "records": 0, "retries": 0})
+            entry["latencies"].append(seconds)
+            entry["errors"] += error
+            for key, value in counts.items():
+                entry[key] += value
+
+    @contextlib.contextmanager
+    def span(self, stage: str, resource: str = "") -> Iterator[dict[str, int]]:
+        """
+        Time the code run inside the context as one occurrence of a stage, failed if it raises.
+        Args:
+            stage: the name of the stage.
+            resource: the resource type or pipeline it works on, if any.
+        Yields:
+            the bytes, records and retries counters of the span, to be updated by the code it times.
+        """
+        counts = {"bytes": 0, "records": 0, "retries": 0}
+        started = time.perf_counter()
+        error = False
+        try:
+            yield counts
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - started, resource, error, **counts)
+
+    def summary(self) -> list[dict[str, Any]]:
+        """
+        Aggregate the spans recorded so far.
+        Returns:
+            for each stage and resource, the number of spans, failures, total/p50/p95/max seconds, bytes, records and retries.
+        """
+        with self._lock:
+            stages = {key: dict(entry, latencies=list(entry["latencies"])) for key, entry in self._stages.items()}
+        return [{
+            "stage": stage,
+            "resource": resource,
+            "count": len(entry["latencies"]),
+            "errors": entry["errors"],
+            "total_seconds": sum(entry["latencies"]),
+            "p50_seconds": percentile(entry["latencies"], 50),
+            "p95_seconds": percentile(entry["latencies"], 95),
+            "max_seconds": max(entry["latencies"], default=0.0),
+            "bytes": entry["bytes"],
+            "records": entry["records"],
+            "retries": entry["retries"],
+        } for (stage, resource), entry in sorted(stages.items())]
+
+run_metrics = RunMetrics()
+
+def prometheus_labels(**labels: str) -> str:
+    """
+    Format labels of a Prometheus sample, leaving out empty ones.
+    Args:
+        labels: the label values keyed by label name.
+    Returns:
+        the labels between braces, or an empty string if there are none.
+    """
+    values = []
+    for name, value in labels.items():
+        if value != "":
+            escaped = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+            values.append(f"{name}=\"{escaped}\"")
+    return "{" + ",".join(values) + "}" if values else ""
+
+def prometheus_text(summary: dict[str, Any]) -> str:
+    """
+    Render a run summary in the Prometheus text exposition format.
+    Args:
+        summary: the run summary built by build_run_summary.
+    Returns:
+        the text of the metrics.
+    """
+    lines = [
+        "# HELP confluence_run_duration_seconds Wall time of the last run.",
+        "# TYPE confluence_run_duration_seconds gauge",
+        f"confluence_run_duration_seconds {summary["seconds"]}",
+        "# HELP confluence_run_finished_timestamp_seconds When the last run finished.",
+        "# TYPE confluence_run_finished_timestamp_seconds gauge",
+        f"confluence_run_finished_timestamp_seconds {summary["finished_at"]}",
+        "# HELP confluence_run_pipelines_failed Pipelines of the last run that did not complete.",
+        "# TYPE confluence_run_pipelines_failed gauge",
+        f"confluence_run_pipelines_failed {len(summary["failed_pipelines"])}",
+        "# HELP confluence_stage_duration_seconds Time spent in each occurrence of a stage.",
+        "# TYPE confluence_stage_duration_seconds summary",
+    ]
+    for entry in summary["stages"]:
+        labels = {"stage": entry["stage"], "resource": entry["resource"]}
+        lines.append(f"confluence_stage_duration_seconds{prometheus_labels(**labels, quantile="0.5")} {entry["p50_seconds"]}")
+        lines.append(f"confluence_stage_duration_seconds{prometheus_labels(**labels, quantile="0.95")} {entry["p95_seconds"]}")
+        lines.append(f"confluence_stage_duration_seconds_sum{prometheus_labels(**labels)} {entry["total_seconds"]}")
+        lines.append(f"confluence_stage_duration_seconds_count{prometheus_labels(**labels)} {entry["count"]}")
+    for counter in ("errors", "bytes", "records", "retries"):
+        lines.append(f"# HELP confluence_stage_{counter}_total {counter.capitalize()} handled by each stage.")
+        lines.append(f"# TYPE confluence_stage_{counter}_total counter")
+        for entry in summary["stages"]:
+            lines.append(f"confluence_stage_{counter}_total{prometheus_labels(stage=entry["stage"], resource=entry["resource"])} {entry[counter]}")
+    lines.append("# HELP confluence_pipeline_stage_seconds Time each pipeline spent in each of its stages.")
+    lines.append("# TYPE confluence_pipeline_stage_seconds gauge")
+    for name, stages in summary["pipelines"].items():
+        for stage, seconds in stages.items():
+            lines.append(f"confluence_pipeline_stage_seconds{prometheus_labels(pipeline=name, stage=stage)} {seconds}")
+    for counter in ("requests", "retries", "throttled", "not_modified", "retry_wait_seconds"):
+        lines.append(f"# HELP confluence_api_{counter}_total API page {counter.replace("_", " ")} per resource type.")
+        lines.append(f"# TYPE confluence_api_{counter}_total counter")
+        for resource_type, metrics in summary["api"].items():
+            lines.append(f"confluence_api_{counter}_total{prometheus_labels(resource=resource_type)} {metrics[counter]}")
+    return "\n".join(lines) + "\n"
+
+def build_run_summary(names: list[str], timings: dict[str, dict[str, float]], seconds: float) -> dict[str, Any]:
+    """
+    Gather the metrics of a run in one summary.
+    Args:
+        names: the names of the pipelines the run started.
+        timings: the stage timings of each pipeline that completed.
+        seconds: the wall time of the run.
+    Returns:
+        the run summary, with the aggregated spans of every stage, the pipeline timings and the API, HTTP and GCS counters.
+    """
+    return {
+        "finished_at": time.time(),
+        "seconds": seconds,
+        "failed_pipelines": [name for name in names if name not in timings],
+        "pipelines": timings,
+        "stages": run_metrics.summary(),
+        "api": api_metrics(),
+        "http": http_connection_stats() if _http_session is not None else {},
+        "gcs_uploads": gcs_writer.stats(),
+    }
+
+def export_run_summary(summary: dict[str, Any]) -> None:
+    """
+    Write a run summary to METRICS_JSON_LOCATION and METRICS_PROMETHEUS_FILE, when they are set.
+    Exporting never fails the run.
+    Args:
+        summary: the run summary built by build_run_summary.
+    """
+    try:
+        if METRICS_JSON_LOCATION:
+            write_state_file(METRICS_JSON_LOCATION, summary)
+        if METRICS_PROMETHEUS_FILE:
+            # written next to the target and renamed, so a collector never reads a partial file
+            temporary_path = f"{METRICS_PROMETHEUS_FILE}.{os.getpid()}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as fp:
+                fp.write(prometheus_text(summary))
+            os.replace(temporary_path, METRICS_PROMETHEUS_FILE)
+    except Exception as e:
+        LOGGER.error("[export_run_summary] Could not export the run metrics: %s", e)
+
+class GCSWriter:
+    """
+    Uploads files to a GCS bucket. The bucket and each directory are checked, and created if needed,
+    once per run instead of before every upload, and the latency and size of every upload is recorded.
+    """
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self._bucket: storage.Bucket | None = None
+        self._bucket_ready = False
+        self._ready_directories: set[str] = set()
+        self._lock = threading.Lock()
+        self._latencies: list[float] = []
+        self._bytes_uploaded = 0
+
+    @property
+    def bucket(self) -> storage.Bucket:
+        """The bucket, created from the shared storage client on first use."""
+        if self._bucket is None:
+            self._bucket = get_gcs_storage_client().bucket(self.bucket_name)
+        return self._bucket
+
+    def prepare(self, directory_name: str) -> str:
+        """
+        Make sure the bucket and a directory exist, only calling GCS the first time a directory is seen.
+        Args:
+            directory_name: the name of the GCS directory.
+        Returns:
+            the directory name ending with a slash.
+        """
+        if directory_name[-1] != "/":
+            directory_name = directory_name + "/"
+
+        with self._lock:
+            if not self._bucket_ready:
+                self._bucket_ready = gcs_check_and_create_bucket(self.bucket, self.bucket_name)
+            if directory_name not in self._ready_directories:
+                gcs_add_directory(directory_name)
+                self._ready_directories.add(directory_name)
+        return directory_name
+
+    def new_blob(self, filename: str, directory_name: str = "confluence_attachments/", chunk_size: int | None = None) -> storage.Blob:
+        """
+        Create a blob for a file in a directory of the bucket.
+        Args:
+            filename: the name of the file in GCS.
+            directory_name: the name of the GCS directory holding the file.
+            chunk_size: the size of the chunks of a resumable upload, None for a single request upload.
+        Returns:
+            the blob the file can be uploaded to.
+        """
+        return self.bucket.blob(self.prepare(directory_name) + filename, chunk_size=chunk_size)
+
+    def record_upload(self, started: float, size: int) -> None:
+        """
+        Record an upload in the writer's metrics.
+        Args:
+            started: the time.perf_counter() value when the upload started.
+            size: the number of bytes uploaded.
+        """
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._latencies.append(seconds)
+            self._bytes_uploaded += size
+        run_metrics.observe("gcs_upload", seconds, bytes=size)
+
+    def upload_file(self, file_path: str, directory_name: str = "confluence_attachments/", object_name: str | None = None) -> str:
+        """
+        Upload a local file to a directory of the bucket.
+        Args:
+            file_path: local file path to the file to add to GCS
+            directory_name: the name of the GCS directory to upload the file to.
+            object_name: the name of the file in the directory, defaults to the name of the local file.
+        Returns:
+            the public url of the file
+        """
+        blob = self.new_blob(object_name or os.path.basename(file_path), directory_name)
+        started = time.perf_counter()
+        blob.upload_from_filename(file_path)
+        self.record_upload(started, os.path.getsize(file_path))
+        return blob.self_link
+
+    def stats(self) -> dict[str, float]:
+        """
+        Summarize the uploads done so far.
+        Returns:
+            the number of uploads, bytes uploaded and the p50/p95/max upload latency in seconds.
+        """
+        with self._lock:
+            latencies = list(self._latencies)
+            uploaded = self._bytes_uploaded
+        return {
+            "uploads": len(latencies),
+            "bytes": uploaded,
+            "p50_seconds": percentile(latencies, 50),
+            "p95_seconds": percentile(latencies, 95),
+            "max_seconds": max(latencies, default=0.0),
+        }
+
+gcs_writer = GCSWriter(gcs_bucket_name)
+
+def read_state_file(location: str) -> dict[str, Any] | None:
+    """
+    Read a JSON state file kept between runs.
+    Args:
+        location: a local path or a gs://bucket/object url.
+    Returns:
+        the decoded state, or None if the file does not exist yet.
+    """
+    try:
+        if location.startswith("gs://"):
+            bucket_name, _, blob_name = location.removeprefix("gs://").partition("/")
+            return json.loads(get_gcs_storage_client().bucket(bucket_name).blob(blob_name).download_as_text())
+        with open(location, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (NotFound, FileNotFoundError):
+        return None
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def write_state_file(location: str, state: dict[str, Any]) -> None:
+    """
+    Write a JSON state file kept between runs, retried as GCS throttles frequent writes to the same object.
+    Args:
+        location: a local path or a gs://bucket/object url.
+        state: the state to write.
+    """
+    if location.startswith("gs://"):
+        bucket_name, _, blob_name = location.removeprefix("gs://").partition("/")
+        get_gcs_storage_client().bucket(bucket_name).blob(blob_name).upload_from_string(
+            json.dumps(state), content_type="application/json")
+        return
+
+    if os.path.dirname(location):
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+    tmp_location = location + ".tmp"
+    with open(tmp_location, "w", encoding="utf-8") as fp:
+        json.dump(state, fp)
+    os.replace(tmp_location, location)
+
+def attachment_index_key(item: dict[str, Any]) -> str | None:
+    """
+    Build the key identifying an attachment version in the attachment index.
+    Args:
+        item: the attachment record, before or after cleaning.
+    Returns:
+        the key made of the attachment id and version number, or None if either is missing.
+    """
+    version = item.get("version")
+    if isinstance(version, str) and version.startswith("{"):
+        # cleaned records hold the version serialized to JSON
+        version = json.loads(version)
+    if isinstance(version, dict):
+        version = version.get("number")
+    if item.get("id") is None or version is None:
+        return None
+    return f"{item.get("id")}:{version}"
+
+def attachment_object_prefix(item: dict[str, Any]) -> str:
+    """
+    Build the path an attachment's file is uploaded under in GCS, unique to the attachment version,
+    so two attachments with the same file name never overwrite each other.
+    Args:
+        item: the attachment record, before or after cleaning.
+    Returns:
+        "<id>/<version number>", or a random prefix for a record without id or version.
+    """
+    key = attachment_index_key(item)
+    return key.replace(":", "/") if key else uuid.uuid4().hex
+
+def attachment_object_name(item: dict[str, Any], file_path: str) -> str:
+    """
+    Build the name of a downloaded attachment's file in GCS, under its attachment_object_prefix.
+    Args:
+        item: the cleaned attachment record.
+        file_path: the path the file was downloaded to, its name gets a (n) suffix when another download had the same name.
+    Returns:
+        "<id>/<version number>/<file name>", with the file name of the download link.
+    """
+    filename = item.get("downloadLink", "").split("/")[-1].split("?")[0] or os.path.basename(file_path)
+    return f"{attachment_object_prefix(item)}/{filename}"
 
-    gcs_add_directory(directory_name)
+class StateIndex:
+    """
+    Index of the objects already uploaded to GCS, loaded on first use, kept between runs in a state file
+    and bounded to the most recently seen entries. Subclasses define what an entry holds.
+    """
+    def __init__(self, location: str, max_entries: int):
+        self.location = location
+        self.max_entries = max_entries
+        self._entries: dict[str, dict[str, Any]] | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if self._entries is None:
+            try:
+                self._entries = (read_state_file(self.location) or {}).get("entries", {})
+            except Exception as e:
+                LOGGER.error("[%s] Error reading the index, starting empty: %s", type(self).__name__, e)
+                self._entries = {}
+        return self._entries
+
+    def save(self) -> None:
+        """Write the index back to its state file, keeping only the most recently seen entries."""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = self._load()
+            if len(entries) > self.max_entries:
+                newest = sorted(entries.items(), key=lambda entry: entry[1]["lastSeen"], reverse=True)
+                self._entries = entries = dict(newest[:self.max_entries])
+            write_state_file(self.location, {"entries": entries})
+            self._dirty = False
+        LOGGER.info("[%s] Saved %d entries to %s", type(self).__name__, len(entries), self.location)
+
+class AttachmentIndex(StateIndex):
+    """
+    Index of the attachment versions already uploaded to GCS, so unchanged attachments can reuse
+    their gcsLink instead of being downloaded and uploaded again. Each version is uploaded to its own object,
+    see attachment_object_prefix, so a link is never overwritten by another attachment; entries recorded
+    before the objects were named per version are not reused.
+    """
+    def lookup(self, key: str | None, file_id: str | None = None) -> str | None:
+        """
+        Get the GCS link of an attachment version that was already uploaded.
+        Args:
+            key: the key of the attachment version, see attachment_index_key.
+            file_id: the fileId of the attachment, when known the indexed one must match it.
+        Returns:
+            the gcsLink of the uploaded file, or None if it has to be uploaded.
+        """
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._load().get(key)
+        if not entry or not entry.get("versioned") or (file_id and entry.get("fileId") and entry["fileId"] != file_id):
+            return None
+        return entry["gcsLink"]
+
+    def record(self, key: str | None, file_id: str | None, gcs_link: str) -> None:
+        """
+        Remember the GCS link of an attachment version and mark it as seen in this run.
+        Args:
+            key: the key of the attachment version, see attachment_index_key.
+            file_id: the fileId of the attachment.
+            gcs_link: the gcsLink of the uploaded file.
+        """
+        if key is None:
+            return
+        with self._lock:
+            self._load()[key] = {"fileId": file_id, "gcsLink": gcs_link, "versioned": True, "lastSeen": datetime.now().isoformat()}
+            self._dirty = True
+
+attachment_index = AttachmentIndex(ATTACHMENT_INDEX_LOCATION, ATTACHMENT_INDEX_MAX_ENTRIES)
+
+class BodyIndex(StateIndex):
+    """
+    Index of the sha256 of the page and blog post bodies already uploaded to GCS. Bodies are stored
+    under their hash, so a body seen before, in any version of any record, is not uploaded again.
+    """
+    def seen(self, sha256: str) -> bool:
+        """
+        Check whether a body was already uploaded, and mark it as seen in this run if it was.
+        Args:
+            sha256: the hex digest of the body.
+        Returns:
+            True if the body is in GCS already.
+        """
+        with self._lock:
+            entry = self._load().get(sha256)
+            if entry is None:
+                return False
+            entry["lastSeen"] = datetime.now().isoformat()
+            self._dirty = True
+        return True
+
+    def record(self, sha256: str) -> None:
+        """
+        Remember that a body was uploaded.
+        Args:
+            sha256: the hex digest of the body.
+        """
+        with self._lock:
+            self._load()[sha256] = {"lastSeen": datetime.now().isoformat()}
+            self._dirty = True
 
-    blob = gcs_bucket.blob(directory_name + os.path.basename(file_path))
-    blob.upload_from_filename(file_path)
-    return blob.self_link
+body_index = BodyIndex(BODY_INDEX_LOCATION, BODY_INDEX_MAX_ENTRIES)
+
+class CheckpointStore:
+    """
+    High-water marks of each resource type, so a run only fetches what changed since the last successful load.
+    A run opens a pending checkpoint per resource type holding the start of its window and the cursor of the
+    last page written; the window start becomes the new watermark once the data is loaded. A pending checkpoint
+    left by a failed run is picked up again by the next one.
+    The cursors of pages written to local staging files are only kept in a local file next to them, the state
+    file, usually a GCS object that takes about one write per second, is only written when a watermark moves or
+    when the cursor of data already loaded into BigQuery is checkpointed, and never while the store is locked.
+    """
+    def __init__(self, location: str, cursor_location: str):
+        self.location = location
+        self.cursor_location = cursor_location
+        self._state: dict[str, dict[str, Any]] | None = None
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._version = 0
+        self._written_version = 0
+
+    def _load(self) -> dict[str, dict[str, Any]]:
+        if self._state is None:
+            self._state = (read_state_file(self.location) if self.location else None) or {}
+            self._pending = {resource_type: dict(checkpoint["pending"])
+                             for resource_type, checkpoint in self._state.items() if "pending" in checkpoint}
+            # cursors written on this machine by a failed run are newer than the state file, when they are for the same window
+            for resource_type, pending in ((read_state_file(self.cursor_location) if self.location else None) or {}).items():
+                if pending.get("since") == self._window_start(resource_type):
+                    self._pending[resource_type] = pending
+        return self._state
+
+    def _window_start(self, resource_type: str) -> str:
+        checkpoint = self._state.get(resource_type, {})
+        if "pending" in checkpoint:
+            return checkpoint["pending"]["since"]
+        yesterday = (datetime.today() - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return checkpoint.get("watermark") or yesterday.isoformat(timespec="minutes")
+
+    def _save_cursors(self) -> None:
+        # called with the lock held, the file is small and local
+        if self.location:
+            write_state_file(self.cursor_location, self._pending)
+
+    def _save(self) -> None:
+        """Write the state file, skipping the write if a newer state was written by another thread in the meantime."""
+        if not self.location:
+            return
+        with self._lock:
+            self._version += 1
+            version, state = self._version, copy.deepcopy(self._state)
+        with self._write_lock:
+            if version > self._written_version:
+                write_state_file(self.location, state)
+                self._written_version = version
+
+    def begin(self, resource_type: str) -> dict[str, Any]:
+        """
+        Get the pending checkpoint of a resource type, opening a new one starting at the watermark if needed.
+        Args:
+            resource_type: the type of resource, a key of RESOURCE_TYPES.
+        Returns:
+            a copy of the pending checkpoint: the window start "since", the "cursor" of the next page to fetch
+            and whether all the pages are "done".
+        """
+        with self._lock:
+            self._load()
+            if resource_type not in self._pending:
+                self._pending[resource_type] = {
+                    "since": self._window_start(resource_type),
+                    "startedAt": datetime.now().isoformat(timespec="minutes"),
+                    "cursor": "",
+                    "done": False,
+                }
+                self._save_cursors()
+            return dict(self._pending[resource_type])
+
+    def advance(self, resource_type: str, cursor: str, loaded: bool = False) -> None:
+        """
+        Record that a page was written and where to continue from.
+        Args:
+            resource_type: the type of resource, a key of RESOURCE_TYPES.
+            cursor: the cursor of the next page, empty after the last page.
+            loaded: the pages before the cursor are loaded into BigQuery, so the cursor is also written to the state file
+                and a run on another machine resumes after them.
+        """
+        with self._lock:
+            pending = self._pending[resource_type]
+            pending["cursor"] = cursor
+            pending["done"] = not cursor
+            self._save_cursors()
+            if loaded:
+                self._state.setdefault(resource_type, {})["pending"] = dict(pending)
+        if loaded:
+            self._save()
+
+    def restart(self, resource_type: str) -> None:
+        """
+        Forget the pages written by a failed run, keeping its window, when they were not kept.
+        Args:
+            resource_type: the type of resource, a key of RESOURCE_TYPES.
+        """
+        self.begin(resource_type)
+        with self._lock:
+            pending = self._pending[resource_type]
+            pending["cursor"] = ""
+            pending["done"] = False
+            self._save_cursors()
+            if "pending" in self._state.get(resource_type, {}):
+                self._state[resource_type]["pending"] = dict(pending)
+
+    def commit(self, resource_type: str) -> None:
+        """
+        Move the watermark to the start of the pending window once its data is loaded.
+        Args:
+            resource_type: the type of resource, a key of RESOURCE_TYPES.
+        """
+        with self._lock:
+            self._load()
+            pending = self._pending.pop(resource_type, None)
+            if pending is None:
+                return
+            checkpoint = self._state.setdefault(resource_type, {})
+            checkpoint.pop("pending", None)
+            checkpoint["watermark"] = pending["startedAt"]
+            self._save_cursors()
+        self._save()
+        LOGGER.info("[CheckpointStore] %s watermark moved to %s", resource_type, checkpoint["watermark"])
+
+checkpoint_store = CheckpointStore(CHECKPOINT_LOCATION, f"{tmp_outpath}/checkpoint_cursors.json")
+
+def entity_version(item: dict[str, Any]) -> str:
+    """
+    Get the value identifying the version of a raw record in the response cache.
+    Args:
+        item: the raw record.
+    Returns:
+        its version number, its updatedAt for tasks, or a fingerprint of the whole record for spaces and other unversioned records.
+    """
+    version = item.get("version")
+    if isinstance(version, dict):
+        version = version.get("number")
+    if version is None:
+        version = item.get("updatedAt")
+    if version is None:
+        version = hashlib.sha1(dumps_json(item).encode("utf-8")).hexdigest()
+    return str(version)
+
+class ResponseCache:
+    """
+    On-disk SQLite cache of the version of every record loaded and of the validators (ETag, Last-Modified) and body
+    of every API page fetched, bounded to the most recently used entries. Records whose version was already loaded are
+    skipped before cleaning, and pages are requested conditionally so an unchanged page is not sent again: the cached
+    body is replayed instead, so the parents it lists still reach the reference index and the space listing.
+    Pages are matched on their url and cursor, without the modification window of the run, see request_key.
+    Record versions are only written to the cache when their pipeline's data is loaded, like the checkpoints,
+    so a failed run never hides records that did not reach BigQuery; a replayed page goes through the same check.
+    """
+    def __init__(self, location: str, max_entries: int):
+        self.location = location
+        self.max_entries = max_entries
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._pending_records: dict[str, dict[str, str]] = {}
+        self._skipped: dict[str, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            if os.path.dirname(self.location):
+                os.makedirs(os.path.dirname(self.location), exist_ok=True)
+            self._db = sqlite3.connect(self.location, check_same_thread=False)
+            self._db.executescript("""
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS records (
+                    pipeline TEXT NOT NULL, id TEXT NOT NULL, version TEXT NOT NULL, last_used REAL NOT NULL,
+                    PRIMARY KEY (pipeline, id));
+                CREATE INDEX IF NOT EXISTS records_last_used ON records (last_used);
+                CREATE TABLE IF NOT EXISTS pages (
+                    request TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, next_link TEXT NOT NULL, last_used REAL NOT NULL,
+                    body BLOB);
+                CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+            """)
+            # pages cached before their body was kept can't be replayed, they are requested unconditionally again
+            if "body" not in {column[1] for column in self._db.execute("PRAGMA table_info(pages)")}:
+                self._db.execute("ALTER TABLE pages ADD COLUMN body BLOB")
+        return self._db
+
+    def changed(self, name: str, items: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Drop the records of a pipeline whose version was already loaded by an earlier run.
+        Args:
+            name: the key of the pipeline in RESOURCE_PIPELINES the records belong to.
+            items: the raw records.
+        Returns:
+            the records that are new or changed, in their original order.
+        """
+        if not self.location or not items:
+            return items
+        versions = [(str(item["id"]) if item.get("id") is not None else None, entity_version(item)) for item in items]
+        ids = [record_id for record_id, _ in versions if record_id is not None]
+        with self._lock:
+            db = self._connect()
+            cached: dict[str, str] = {}
+            # SQLite binds at most 32766 variables per statement
+            for start in range(0, len(ids), 10000):
+                chunk = ids[start:start + 10000]
+                cached.update(db.execute(f"SELECT id, version FROM records WHERE pipeline = ? AND id IN ({", ".join("?" * len(chunk))})",
+                                         [name, *chunk]).fetchall())
+            unchanged = [record_id for record_id, version in versions if record_id is not None and cached.get(record_id) == version]
+            db.executemany("UPDATE records SET last_used = ? WHERE pipeline = ? AND id = ?",
+                           [(time.time(), name, record_id) for record_id in unchanged])
+            db.commit()
+            pending = self._pending_records.setdefault(name, {})
+            changed_items = []
+            for item, (record_id, version) in zip(items, versions):
+                if record_id is None or cached.get(record_id) != version:
+                    changed_items.append(item)
+                    if record_id is not None:
+                        pending[record_id] = version
+            self._skipped[name] = self._skipped.get(name, 0) + len(items) - len(changed_items)
+        return changed_items
+
+    @staticmethod
+    def request_key(url: str, params: dict[str, Any]) -> str:
+        # the cql window moves on every run, a page is the same request as long as its url and cursor are,
+        # and the API decides from the validators whether what the new window returns for it changed
+        return f"{url}?{urlencode(sorted((key, value) for key, value in params.items() if key != "cql"))}"
+
+    def page_validators(self, url: str, params: dict[str, Any]) -> tuple[dict[str, str], dict[str, Any] | None]:
+        """
+        Get the conditional request headers of an API page fetched by an earlier run.
+        Args:
+            url: the url of the resource.
+            params: the query parameters of the page.
+        Returns:
+            the If-None-Match/If-Modified-Since headers to send, empty if the page is not cached,
+            and the cached body of the page to use when the API answers 304 Not Modified.
+        """
+        if not self.location:
+            return {}, None
+        with self._lock:
+            db = self._connect()
+            key = self.request_key(url, params)
+            row = db.execute("SELECT etag, last_modified, body FROM pages WHERE request = ? AND body IS NOT NULL", (key,)).fetchone()
+            if row is None:
+                return {}, None
+            db.execute("UPDATE pages SET last_used = ? WHERE request = ?", (time.time(), key))
+            db.commit()
+        etag, last_modified, body = row
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers, json.loads(zlib.decompress(body))
+
+    def record_page(self, url: str, params: dict[str, Any], etag: str | None, last_modified: str | None, body: bytes) -> None:
+        """
+        Remember the validators and body of an API page, so the next run can request it conditionally.
+        Args:
+            url: the url of the resource.
+            params: the query parameters of the page.
+            etag: the ETag header of the response.
+            last_modified: the Last-Modified header of the response.
+            body: the JSON body of the response.
+        """
+        if not self.location or not (etag or last_modified):
+            return
+        # the link to the next page is read from the body when it is replayed, the column is kept for older caches
+        stored = zlib.compress(body, 1)
+        with self._lock:
+            db = self._connect()
+            db.execute("INSERT OR REPLACE INTO pages (request, etag, last_modified, next_link, last_used, body) VALUES (?, ?, ?, ?, ?, ?)",
+                       (self.request_key(url, params), etag, last_modified, "", time.time(), stored))
+            db.commit()
+
+    def commit(self, name: str) -> None:
+        """
+        Write the record versions a pipeline saw in this run once its data is loaded,
+        then drop the least recently used records and pages above max_entries.
+        Args:
+            name: the key of the pipeline in RESOURCE_PIPELINES.
+        """
+        if not self.location:
+            return
+        with self._lock:
+            db = self._connect()
+            now = time.time()
+            records = self._pending_records.pop(name, {})
+            db.executemany("INSERT OR REPLACE INTO records (pipeline, id, version, last_used) VALUES (?, ?, ?, ?)",
+                           [(name, record_id, version, now) for record_id, version in records.items()])
+            for table in ("records", "pages"):
+                db.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY last_used "
+                           f"LIMIT max(0, (SELECT count(*) FROM {table}) - ?))", (self.max_entries,))
+            db.commit()
+            skipped = self._skipped.pop(name, 0)
+        LOGGER.info("[ResponseCache] %s: %d unchanged records skipped, %d versions cached", name, skipped, len(records))
+
+response_cache = ResponseCache(RESPONSE_CACHE_LOCATION, RESPONSE_CACHE_MAX_ENTRIES)
+
+class ReferenceIndex:
+    """
+    In-run index of the spaces, pages and blog posts extracted so far, so the records referencing them get the
+    space key and page or blog post title denormalized with dictionary lookups as they stream through cleaning,
+    instead of joining the daily tables in BigQuery. Parent records are indexed before the response cache drops
+    the unchanged ones, and a pipeline enriching its records first waits until its parents are done extracting.
+    Only the parents extracted in the same run are known, references to older ones are left empty.
+    """
+    def __init__(self):
+        self._space_keys: dict[str, str] = {}
+        self._containers: dict[str, dict[str, tuple[str | None, str | None]]] = {"pages": {}, "blogposts": {}}
+        # set while a pipeline is not extracting, so pipelines run on their own never wait
+        self._extracted = {name: threading.Event() for name in RESOURCE_PIPELINES}
+        for extracted in self._extracted.values():
+            extracted.set()
+
+    def start(self, names: list[str]) -> None:
+        """
+        Forget the previous run and mark the pipelines of this one as extracting.
+        Args:
+            names: the names of the pipelines the run starts.
+        """
+        self._space_keys = {}
+        self._containers = {"pages": {}, "blogposts": {}}
+        for name, extracted in self._extracted.items():
+            if name in names and REFERENCE_ENRICHMENT == "index":
+                extracted.clear()
+            else:
+                extracted.set()
+
+    def done(self, name: str) -> None:
+        """
+        Mark a pipeline as done extracting, successfully or not, releasing the pipelines waiting for it.
+        Args:
+            name: the key of the pipeline in RESOURCE_PIPELINES.
+        """
+        self._extracted[name].set()
+
+    def add(self, name: str, items: list[dict[str, Any]]) -> None:
+        """
+        Index the raw records of a parent pipeline.
+        Args:
+            name: the key of the pipeline in RESOURCE_PIPELINES the records belong to.
+            items: the raw records.
+        """
+        if REFERENCE_ENRICHMENT != "index":
+            return
+        if name == "spaces":
+            self._space_keys.update((str(item["id"]), item.get("key")) for item in items if item.get("id") is not None)
+        elif name in self._containers:
+            self._containers[name].update((str(item["id"]), (item.get("title"), item.get("spaceId")))
+                                          for item in items if item.get("id") is not None)
+
+    def enrich(self, name: str, records: list[dict[str, Any]]) -> None:
+        """
+        Fill the spaceId, spaceKey, pageTitle and blogPostTitle columns of a pipeline's cleaned records,
+        once the pipelines they reference are done extracting. Columns missing from the table are left out.
+        Args:
+            name: the key of the pipeline in RESOURCE_PIPELINES the records belong to.
+            records: the cleaned records, updated in place.
+        """
+        pipeline = RESOURCE_PIPELINES[name]
+        if REFERENCE_ENRICHMENT != "index" or not pipeline["parents"] or not records:
+            return
+        for parent in pipeline["parents"]:
+            self._extracted[parent].wait()
+
+        columns = {field.name for field in pipeline["schema"]}
+        space_keys, pages, blogposts = self._space_keys, self._containers["pages"], self._containers["blogposts"]
+        with run_metrics.span("enrich", name) as span:
+            for record in records:
+                page = pages.get(record.get("pageId"))
+                blogpost = blogposts.get(record.get("blogPostId"))
+                container = page or blogpost
+                if page and page[0] is not None and "pageTitle" in columns:
+                    record["pageTitle"] = page[0]
+                if blogpost and blogpost[0] is not None and "blogPostTitle" in columns:
+                    record["blogPostTitle"] = blogpost[0]
+                space_id = record.get("spaceId") or (container[1] if container else None)
+                if space_id is None:
+                    continue
+                if "spaceId" in columns:
+                    record["spaceId"] = space_id
+                if space_keys.get(space_id) is not None:
+                    record["spaceKey"] = space_keys[space_id]
+                    span["records"] += 1
+
+reference_index = ReferenceIndex()
 
 def download_and_verify_confluence_file(file_url: str, storage_location: str = tmp_outpath) -> str | None:
     """
@@ -230,10 +1596,14 @@ def download_and_verify_confluence_file(file_url: str, storage_location: str = t
     Returns:
         The path to where the file was stored.
     """
-    file_path = download_confluence_file(file_url, storage_location)
+    with run_metrics.span("attachment_download") as span:
+        file_path = download_confluence_file(file_url, storage_location)
+        span["bytes"] = os.path.getsize(file_path) if file_path else 0
 
     if file_path:
-        if verify_file_content(file_path):
+        with run_metrics.span("attachment_verify"):
+            verified = verify_file_content(file_path)
+        if verified:
             LOGGER.info("[download_and_verify_jira_file] ✓ File downloaded and verified successfully")
         else:
             LOGGER.warning("[download_and_verify_jira_file] ⚠ File may be corrupted or in unexpected format")
@@ -249,31 +1619,47 @@ def download_confluence_file(file_url: str, save_dir: str) -> str:
         file_url: the url of the file to download
         save_dir: directory where the file should be saved
     Returns:
-        path to where the file has been saved
+        path to where the file has been saved, or an empty string if the download failed
     """
     save_path = ""
     try:
         # file_url format: /download/attachments/818577942/image2021-4-12_13-0-42.png?version=1&modificationDate=1618225243798&cacheVersion=1&api=v2
         download_url = os.getenv("BASE_URL").removesuffix("api/v2/") + file_url.removeprefix("/")
-        response = requests.get(download_url, auth=auth_token, stream=True, timeout=15)
-        response.raise_for_status()
-
-        filename = file_url.split("/")[-1].split("?")[0]
-        if not filename:
-            content_type = response.headers.get("content-type", "").split(";")[0]
-            ext = mimetypes.guess_extension(content_type) or ""
-            filename = f"confluence_file{ext}"
-
-        save_path = get_next_filename(os.path.join(save_dir, filename))
-
-        with open(save_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with host_request_slot(download_url):
+            with get_http_session().get(download_url, stream=True, timeout=15) as response:
+                response.raise_for_status()
+
+                filename = file_url.split("/")[-1].split("?")[0]
+                if not filename:
+                    content_type = response.headers.get("content-type", "").split(";")[0]
+                    ext = mimetypes.guess_extension(content_type) or ""
+                    filename = f"confluence_file{ext}"
+
+                with _save_path_lock:
+                    save_path = get_next_filename(os.path.join(save_dir, filename))
+                    open(save_path, "wb").close()
+
+                with open(save_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            f.write(chunk)
     except requests.exceptions.RequestException as e:
         LOGGER.error("[_download_confluence_file] Error: %s", e)
-    finally:
-        return save_path
+        discard_partial_download(save_path)
+        return ""
+    except BaseException:
+        discard_partial_download(save_path)
+        raise
+    return save_path
+
+def discard_partial_download(save_path: str) -> None:
+    """
+    Delete the file of a download that failed part way, so a truncated file is never uploaded.
+    Args:
+        save_path: the path the file was being saved to, empty if the download failed before creating it.
+    """
+    if save_path and os.path.exists(save_path):
+        os.remove(save_path)
 
 def verify_file_content(file_path: str) -> bool:
     """
@@ -286,28 +1672,106 @@ def verify_file_content(file_path: str) -> bool:
     try:
         with open(file_path, "rb") as f:
             header = f.read(8)
+    except IOError:
+        return False
 
-        # Common file signatures
-        file_signatures = {
-            b"%PDF": "PDF file",
-            b"\xFF\xD8\xFF": "JPEG image",
-            b"\x89PNG\r\n\x1A\n": "PNG image",
-            b"PK\x03\x04": "ZIP archive",
-            b"GIF87a": "GIF image",
-            b"GIF89a": "GIF image",
-        }
-
-        for signature, _ in file_signatures.items():
-            if header.startswith(signature):
-                return True
+    return verify_file_header(header)
 
-        # No signature match but file has content
-        if len(header) > 0:
+def verify_file_header(header: bytes) -> bool:
+    """
+    Verify if a file seems to be valid based on its first bytes.
+    Args:
+        header: the first 8 bytes of the file.
+    Returns:
+        True if the file seems valid, otherwise False.
+    """
+    for signature, _ in FILE_SIGNATURES.items():
+        if header.startswith(signature):
             return True
 
-        return False
-    except IOError:
-        return False
+    # No signature match but file has content
+    if len(header) > 0:
+        return True
+
+    return False
+
+class ResponseReader(io.RawIOBase):
+    """
+    Read-only file object over the body of a streamed HTTP response, so it can be handed
+    to a GCS upload without being written to disk. Keeps the first bytes for verification.
+    """
+    def __init__(self, response: requests.Response, chunk_size: int = STREAM_READ_CHUNK_SIZE):
+        self._chunks = response.iter_content(chunk_size=chunk_size)
+        self._buffer = bytearray()
+        self.header = b""
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # resumable uploads check the position of the stream before and after reading each chunk
+        return self.bytes_read
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            if not self.header:
+                self.header = bytes(chunk[:8])
+                if not verify_file_header(self.header):
+                    LOGGER.warning("[ResponseReader] ⚠ File may be corrupted or in unexpected format")
+            self._buffer += chunk
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.bytes_read += len(data)
+        return data
+
+def stream_confluence_file_to_gcs(file_url: str, object_prefix: str) -> str | None:
+    """
+    Pipe a file from Confluence straight into a resumable GCS upload, without touching local disk.
+    The response body can't be rewound, so if the upload fails part way the file is downloaded
+    to disk and uploaded from there instead.
+    Args:
+        file_url: the download url of the file.
+        object_prefix: the path the file is uploaded under in the attachments directory, see attachment_object_prefix.
+    Returns:
+        the public url of the file in GCS, or None if the transfer failed.
+    """
+    download_url = os.getenv("BASE_URL").removesuffix("api/v2/") + file_url.removeprefix("/")
+    reader = None
+    try:
+        with host_request_slot(download_url):
+            with get_http_session().get(download_url, stream=True, timeout=15) as response:
+                response.raise_for_status()
+
+                filename = file_url.split("/")[-1].split("?")[0]
+                content_type = response.headers.get("content-type", "").split(";")[0] or None
+                if not filename:
+                    ext = mimetypes.guess_extension(content_type or "") or ""
+                    filename = f"confluence_file{ext}"
+
+                blob = gcs_new_blob(f"{object_prefix}/{filename}", chunk_size=GCS_UPLOAD_CHUNK_SIZE)
+                reader = ResponseReader(response)
+                started = time.perf_counter()
+                blob.upload_from_file(reader, content_type=content_type, rewind=False)
+                gcs_writer.record_upload(started, reader.bytes_read)
+        LOGGER.info("[stream_confluence_file_to_gcs] ✓ Streamed %d bytes to %s", reader.bytes_read, blob.name)
+        return blob.self_link
+    except Exception as e:
+        if reader is None:
+            LOGGER.error("[stream_confluence_file_to_gcs] Error: %s", e)
+            return None
+        LOGGER.warning("[stream_confluence_file_to_gcs] Streamed upload failed after %d bytes, spilling to disk: %s", reader.bytes_read, e)
+
+    file_path = download_and_verify_confluence_file(file_url, tmp_outpath + "/attachments")
+    if not file_path:
+        return None
+    return gcs_add_file(file_path, object_name=f"{object_prefix}/{filename}")
 
 def get_next_filename(file_path: str) -> str:
     """
@@ -329,269 +1793,2155 @@ def get_next_filename(file_path: str) -> str:
 
     return file_path
 
+def jsonl_file_path(filename_prefix: str) -> str:
+    """
+    Build the path of the day's JSONL file for a resource.
+    Args:
+        filename_prefix: the prefix of the file name, usually the resource name.
+    Returns:
+        the path of the JSONL file in the temporary output folder.
+    """
+    return f"{tmp_outpath}/{filename_prefix}_{datetime.today().strftime("%Y%m%d")}.jsonl"
+
+def dumps_json(value: Any) -> str:
+    """
+    Encode a value to a compact JSON string, with orjson when it is installed.
+    Args:
+        value: the value to encode.
+    Returns:
+        the JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def encode_json_lines(records: list[dict[str, Any]]) -> bytes:
+    """
+    Encode records to the bytes of a JSONL file, one JSON document per line.
+    Args:
+        records: the cleaned records.
+    Returns:
+        the UTF-8 encoded lines.
+    """
+    if orjson is not None:
+        return b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in records)
+    return "".join(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n" for item in records).encode("utf-8")
+
+def write_jsonl_records(data_list: list[dict[str, Any]], file_path: str, mode: str = "a") -> int:
+    """
+    Write records to a JSONL file, one JSON document per line.
+    Args:
+        data_list: the records to write.
+        file_path: the path of the JSONL file.
+        mode: "a" to append to the file, "w" to overwrite it.
+    Returns:
+        the number of records written.
+    """
+    with open(file_path, mode + "b") as fp:
+        fp.write(encode_json_lines(data_list))
+    return len(data_list)
+
 def write_jsonl_file(data_list: list[dict[str, Any]], filename_prefix: str) -> str | None:
     file_path = None
     if data_list:
-        file_path = f"{tmp_outpath}/{filename_prefix}_{datetime.today().strftime("%Y%m%d")}.jsonl"
-        with open(file_path, "w", encoding="utf-8") as fp:
-            for item in data_list:
-                json.dump(item, fp=fp)
-                fp.write("\n")
+        file_path = jsonl_file_path(filename_prefix)
+        write_jsonl_records(data_list, file_path, mode="w")
         LOGGER.info("[write_jsonl_file] Written %d records to %s", len(data_list), file_path)
     else:
         LOGGER.info("[write_jsonl_file] No data for %s to write", filename_prefix)
     return file_path
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def write_table_to_bq(table_id: str, schema: list[bigquery.SchemaField], file: str) -> bool:
+def staging_value(value: Any) -> Any:
     """
-    Writes the data into a new table. If the table exists it is appended to.
+    Convert a cleaned field to the value written to a STRING column of a columnar staging file.
     Args:
-        table_id: the id of the table in Bigquery
-        schema: a list of the table schema in Bigquery
-        file: path to the jsonl file containing the data to insert
+        value: the value of the field.
     Returns:
-        True if data is successfully inserted, otherwise False
+        the value itself if it is a string or None, otherwise its JSON encoding.
     """
-    if os.stat(file).st_size == 0:
-        LOGGER.info("[write_table_to_bq] File %s is empty, no data to write", file)
-        return True
-
-    today = datetime.today().strftime("%Y%m%d")
-    table_id += f"_{today}"
-
-    job_config = bigquery.LoadJobConfig(
-        schema=schema,
-        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
-        max_bad_records=10
-    )
-
-    with open(file, "rb") as fp:
-        try:
-            load_job = bq_client.load_table_from_file(
-                file_obj=fp,
-                destination=table_id,
-                job_config=job_config
-            )
-        except (ValueError, TypeError) as e:
-            LOGGER.error("[write_table_to_bq] Error while loading to BigQuery: %s", e)
-            return False
+    if value is None or isinstance(value, str):
+        return value
+    return dumps_json(value)
 
+class StagingWriter:
+    """
+    Writes cleaned records to a file to be loaded into BigQuery, one JSON document per line.
+    Subclasses write columnar formats built from the table schema.
+    """
+    extension = "jsonl"
+
+    def __init__(self, file_path: str, schema: list[bigquery.SchemaField], append: bool = False):
+        self.file_path = file_path
+        self.schema = schema
+        self._fp = open(file_path, "ab" if append else "wb")
+
+    def write(self, records: list[dict[str, Any]]) -> int:
+        """
+        Write records to the file.
+        Args:
+            records: the cleaned records.
+        Returns:
+            the number of records written.
+        """
+        self._fp.write(encode_json_lines(records))
+        return len(records)
+
+    def size(self) -> int:
+        """The number of bytes written to disk so far."""
+        return os.path.getsize(self.file_path)
+
+    def flush(self) -> None:
+        """Push the records written so far from the file buffer to the file."""
+        self._fp.flush()
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self._fp.close()
+
+class ParquetStagingWriter(StagingWriter):
+    """Writes cleaned records to a compressed Parquet file, STAGING_ROW_GROUP_SIZE records per row group."""
+    extension = "parquet"
+    arrow_types = {"STRING": "string", "INTEGER": "int64", "INT64": "int64", "FLOAT": "float64", "FLOAT64": "float64", "BOOLEAN": "bool_", "BOOL": "bool_"}
+
+    def __init__(self, file_path: str, schema: list[bigquery.SchemaField], append: bool = False):
         try:
-            load_job.result()
-        except Exception as e:
-            LOGGER.error("[write_table_to_bq] Load job failed/did not complete: %s", e)
-            return False
-
-    LOGGER.info("[write_table_to_bq] Successfully written table: %s", table_id)
-    return True
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("STAGING_FORMAT=parquet requires the pyarrow package") from e
+
+        self.file_path = file_path
+        self.schema = schema
+        self._pyarrow = pyarrow
+        self._arrow_schema = pyarrow.schema([
+            pyarrow.field(field.name, getattr(pyarrow, self.arrow_types.get(field.field_type, "string"))())
+            for field in schema
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(file_path, self._arrow_schema, compression=PARQUET_COMPRESSION)
+        self._rows: list[dict[str, Any]] = []
+
+    def write(self, records: list[dict[str, Any]]) -> int:
+        for item in records:
+            self._rows.append({
+                field.name: staging_value(item.get(field.name)) if field.field_type == "STRING" else item.get(field.name)
+                for field in self.schema
+            })
+            if len(self._rows) >= STAGING_ROW_GROUP_SIZE:
+                self._flush()
+        return len(records)
+
+    def _flush(self) -> None:
+        if self._rows:
+            self._writer.write_table(self._pyarrow.Table.from_pylist(self._rows, schema=self._arrow_schema))
+            self._rows = []
+
+    def flush(self) -> None:
+        # rows are written a row group at a time, and a columnar file is never resumed
+        pass
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+class AvroStagingWriter(StagingWriter):
+    """Writes cleaned records to a deflate-compressed Avro file, STAGING_ROW_GROUP_SIZE records per block."""
+    extension = "avro"
+    avro_types = {"STRING": "string", "INTEGER": "long", "INT64": "long", "FLOAT": "double", "FLOAT64": "double", "BOOLEAN": "boolean", "BOOL": "boolean"}
+
+    def __init__(self, file_path: str, schema: list[bigquery.SchemaField], append: bool = False):
+        from fastavro import parse_schema
+        from fastavro.write import Writer
+
+        self.file_path = file_path
+        self.schema = schema
+        avro_schema = parse_schema({
+            "type": "record",
+            "name": "ConfluenceRecord",
+            "fields": [
+                {"name": field.name, "type": ["null", self.avro_types.get(field.field_type, "string")], "default": None}
+                for field in schema
+            ],
+        })
+        self._fp = open(file_path, "wb")
+        self._writer = Writer(self._fp, avro_schema, codec="deflate", sync_interval=STAGING_ROW_GROUP_SIZE)
+
+    def write(self, records: list[dict[str, Any]]) -> int:
+        for item in records:
+            self._writer.write({
+                field.name: staging_value(item.get(field.name)) if field.field_type == "STRING" else item.get(field.name)
+                for field in self.schema
+            })
+        return len(records)
+
+    def close(self) -> None:
+        self._writer.flush()
+        self._fp.close()
+
+class GzipStagingWriter(StagingWriter):
+    """Writes cleaned records to a gzip-compressed JSONL file, compressing them in chunks of STAGING_CHUNK_SIZE bytes."""
+    extension = "jsonl.gz"
+
+    def __init__(self, file_path: str, schema: list[bigquery.SchemaField], append: bool = False):
+        self.file_path = file_path
+        self.schema = schema
+        self._fp = gzip.open(file_path, "wb", compresslevel=6)
+        self._chunk = bytearray()
+
+    def write(self, records: list[dict[str, Any]]) -> int:
+        self._chunk += encode_json_lines(records)
+        if len(self._chunk) >= STAGING_CHUNK_SIZE:
+            self._fp.write(self._chunk)
+            self._chunk.clear()
+        return len(records)
+
+    def close(self) -> None:
+        self._fp.write(self._chunk)
+        self._chunk.clear()
+        self._fp.close()
+
+STAGING_WRITERS: dict[str, type[StagingWriter]] = {
+    "jsonl": StagingWriter,
+    "parquet": ParquetStagingWriter,
+    "avro": AvroStagingWriter,
+}
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def make_api_request(resource_type: str) -> list[dict[str, Any]] | None:
+def staging_file_path(filename_prefix: str) -> str:
     """
-    Make an API request to Confluence API
+    Build the path of the day's staging file for a resource, in the STAGING_FORMAT format.
     Args:
-        resource_type: the type of resource to get
-        **kwargs: appropriate parameters to pass to the query
+        filename_prefix: the prefix of the file name, usually the resource name.
+    Returns:
+        the path of the staging file in the temporary output folder.
     """
-    yesterday = datetime.today() - timedelta(days=1)
-    finished = False
-    next_cursor = ""
-    headers = {
-        "Accept": "application/json"
-    }
-    params = {
+    return f"{tmp_outpath}/{filename_prefix}_{datetime.today().strftime("%Y%m%d")}.{STAGING_WRITERS[STAGING_FORMAT].extension}"
+
+def open_staging_writer(filename_prefix: str, schema: list[bigquery.SchemaField], append: bool = False) -> StagingWriter:
+    """
+    Open a writer for the day's staging file of a resource, in the STAGING_FORMAT format.
+    Args:
+        filename_prefix: the prefix of the file name, usually the resource name.
+        schema: the BigQuery schema of the table the file is loaded into.
+        append: keep the records already in the file, only supported by JSONL files.
+    Returns:
+        the staging writer.
+    """
+    return STAGING_WRITERS[STAGING_FORMAT](staging_file_path(filename_prefix), schema, append=append)
+
+def staging_part_writer_class() -> type[StagingWriter]:
+    """
+    Get the writer of staging parts: JSONL parts are compressed as set by STAGING_PART_COMPRESSION,
+    Parquet and Avro files are compressed by their own writers.
+    Returns:
+        the staging writer class.
+    """
+    if STAGING_FORMAT != "jsonl" or STAGING_PART_COMPRESSION == "none":
+        return STAGING_WRITERS[STAGING_FORMAT]
+    if STAGING_PART_COMPRESSION != "gzip":
+        raise RuntimeError(f"STAGING_PART_COMPRESSION={STAGING_PART_COMPRESSION} is not supported, BigQuery loads JSON compressed with gzip only")
+    return GzipStagingWriter
+
+class SpoolingWriter:
+    """
+    Writes a pipeline's records to a sequence of staging parts, starting a new part once the current one
+    reaches STAGING_PART_SIZE bytes, so neither memory nor disk grow with the size of the resource.
+    Each completed part is handed to a callback with the cursors of the pages it ends with,
+    which the caller sets with mark_page as it consumes each page.
+    """
+    def __init__(self, filename_prefix: str, schema: list[bigquery.SchemaField], on_part: Callable[[str, dict[str, str]], None]):
+        self.filename_prefix = filename_prefix
+        self.schema = schema
+        self.on_part = on_part
+        self.parts = 0
+        self._writer_class = staging_part_writer_class()
+        self._part: StagingWriter | None = None
+        self._part_records = 0
+        self._cursors: dict[str, str] = {}
+
+    def _part_path(self) -> str:
+        return (f"{tmp_outpath}/{self.filename_prefix}_{datetime.today().strftime("%Y%m%d")}"
+                f"_part{self.parts:05d}.{self._writer_class.extension}")
+
+    def write(self, records: list[dict[str, Any]]) -> int:
+        """
+        Write records to the current part, handing the previous part over first if it is full.
+        The part is rotated before writing rather than after, so the cursors marked after a write stay with its part.
+        Args:
+            records: the cleaned records.
+        Returns:
+            the number of records written.
+        """
+        if self._part and self._part.size() >= STAGING_PART_SIZE:
+            self._hand_over()
+        if self._part is None:
+            self._part = self._writer_class(self._part_path(), self.schema)
+            self.parts += 1
+        self._part_records += len(records)
+        return self._part.write(records)
+
+    def mark_page(self, resource_type: str, cursor: str) -> None:
+        """
+        Record that a page was written to the current part and where to continue from.
+        Args:
+            resource_type: the type of resource, a key of RESOURCE_TYPES.
+            cursor: the cursor of the next page, empty after the last page.
+        """
+        self._cursors[resource_type] = cursor
+
+    def _hand_over(self) -> None:
+        part, records, cursors = self._part, self._part_records, self._cursors
+        self._part, self._part_records, self._cursors = None, 0, {}
+        part.close()
+        if records:
+            self.on_part(part.file_path, cursors)
+        else:
+            os.remove(part.file_path)
+
+    def close(self) -> None:
+        """Close the current part and hand it over."""
+        if self._part:
+            self._hand_over()
+
+def remove_staging_parts(filename_prefix: str) -> None:
+    """
+    Delete the staging parts a failed run left for a resource, their pages are fetched again.
+    Args:
+        filename_prefix: the prefix of the file names, usually the resource name.
+    """
+    prefix = f"{filename_prefix}_{datetime.today().strftime("%Y%m%d")}_part"
+    if os.path.isdir(tmp_outpath):
+        for filename in os.listdir(tmp_outpath):
+            if filename.startswith(prefix):
+                os.remove(os.path.join(tmp_outpath, filename))
+
+def write_staging_file(data_list: list[dict[str, Any]], filename_prefix: str, schema: list[bigquery.SchemaField]) -> str | None:
+    """
+    Write records to the day's staging file of a resource, in the STAGING_FORMAT format.
+    Args:
+        data_list: the cleaned records.
+        filename_prefix: the prefix of the file name, usually the resource name.
+        schema: the BigQuery schema of the table the file is loaded into.
+    Returns:
+        the path of the staging file, or None if there were no records.
+    """
+    with run_metrics.span("staging_write", filename_prefix) as span:
+        if STAGING_FORMAT == "jsonl" or not data_list:
+            file_path = write_jsonl_file(data_list, filename_prefix)
+        else:
+            writer = open_staging_writer(filename_prefix, schema)
+            try:
+                writer.write(data_list)
+            finally:
+                writer.close()
+            file_path = writer.file_path
+            LOGGER.info("[write_staging_file] Written %d records to %s", len(data_list), file_path)
+        span["records"] = len(data_list)
+        span["bytes"] = os.path.getsize(file_path) if file_path else 0
+    return file_path
+
+def staging_source_format(file: str) -> str:
+    """
+    Get the BigQuery source format of a staging file from its extension.
+    Args:
+        file: path to the staging file.
+    Returns:
+        the BigQuery source format.
+    """
+    if file.endswith(".parquet"):
+        return bigquery.SourceFormat.PARQUET
+    if file.endswith(".avro"):
+        return bigquery.SourceFormat.AVRO
+    return bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def write_table_to_bq(table_id: str, schema: list[bigquery.SchemaField], file: str) -> bool:
+    """
+    Writes the data into a new table. If the table exists it is appended to.
+    In merge mode the data is loaded into a staging table and merged into the resource's table instead.
+    Args:
+        table_id: the id of the table in Bigquery
+        schema: a list of the table schema in Bigquery
+        file: path to the staging file (jsonl, parquet or avro) containing the data to insert
+    Returns:
+        True if data is successfully inserted, otherwise False
+    """
+    if os.stat(file).st_size == 0:
+        LOGGER.info("[write_table_to_bq] File %s is empty, no data to write", file)
+        return True
+
+    destination, write_disposition = load_destination(table_id)
+    if not load_staging_file(table_id, schema, file, destination, write_disposition):
+        return False
+
+    if BQ_WRITE_MODE == "merge":
+        return merge_staging_table(table_id, schema)
+
+    LOGGER.info("[write_table_to_bq] Successfully written table: %s", destination)
+    return True
+
+def load_staging_file(table_id: str, schema: list[bigquery.SchemaField], file: str, destination: str, write_disposition: str) -> bool:
+    """
+    Load a local staging file into a table and wait for the load job.
+    Args:
+        table_id: the id of the resource's table in Bigquery, used to attribute the metrics
+        schema: a list of the table schema in Bigquery
+        file: path to the staging file (jsonl, jsonl.gz, parquet or avro) containing the data to insert
+        destination: the id of the table the file is loaded into
+        write_disposition: whether to append to the table or replace its content
+    Returns:
+        True if the load job succeeded, otherwise False
+    """
+    job_config = load_job_config(schema, file, write_disposition)
+
+    with open(file, "rb") as fp:
+        try:
+            load_job = get_bq_client().load_table_from_file(
+                file_obj=fp,
+                destination=destination,
+                job_config=job_config
+            )
+        except (ValueError, TypeError) as e:
+            LOGGER.error("[load_staging_file] Error while loading to BigQuery: %s", e)
+            return False
+
+        try:
+            with run_metrics.span("load_job", table_id.split(".")[-1]) as span:
+                load_job.result()
+                span["bytes"] = os.stat(file).st_size
+                span["records"] = load_job.output_rows or 0
+        except Exception as e:
+            LOGGER.error("[load_staging_file] Load job failed/did not complete: %s", e)
+            return False
+    return True
+
+def load_destination(table_id: str) -> tuple[str, str]:
+    """
+    Get the table a staging file is loaded into, depending on BQ_WRITE_MODE.
+    Args:
+        table_id: the id of the resource's table in Bigquery, without date suffix
+    Returns:
+        the id of the day's shard with the append disposition, or in merge mode the id of the day's
+        staging table with the truncate disposition, so reloading it replaces what an earlier attempt loaded.
+    """
+    if BQ_WRITE_MODE == "merge":
+        return staging_table_id(table_id), bigquery.WriteDisposition.WRITE_TRUNCATE
+    return f"{table_id}_{datetime.today().strftime("%Y%m%d")}", bigquery.WriteDisposition.WRITE_APPEND
+
+def staging_table_id(table_id: str) -> str:
+    """
+    Get the id of the day's staging table of a resource, merged into its table in merge mode.
+    Args:
+        table_id: the id of the resource's table in Bigquery
+    Returns:
+        the staging table id
+    """
+    return f"{table_id}_staging_{datetime.today().strftime("%Y%m%d")}"
+
+def merge_staging_table(table_id: str, schema: list[bigquery.SchemaField]) -> bool:
+    """
+    Merge the day's staging table into the resource's table and drop it. The table is created if needed,
+    partitioned by the extractedDate column and clustered by id. The table keeps a single row per id: records are
+    matched on id, a matching row is only updated by a newer version number (always for schemas without a version)
+    and new ids are inserted, which makes reloading the same data a no-op.
+    Args:
+        table_id: the id of the resource's table in Bigquery, without date suffix
+        schema: a list of the table schema in Bigquery
+    Returns:
+        True if the merge succeeded, otherwise False
+    """
+    staging_id = staging_table_id(table_id)
+    columns = [field.name for field in schema]
+    updates = ", ".join(f"`{column}` = S.`{column}`" for column in columns if column != "id")
+    if "version" in columns:
+        def version_number(alias: str) -> str:
+            return f"SAFE_CAST(JSON_VALUE({alias}.`version`, '$.number') AS INT64)"
+        latest = f" ORDER BY {version_number("staging")} DESC"
+        newer = f" AND ({version_number("T")} IS NULL OR {version_number("S")} > {version_number("T")})"
+    else:
+        latest = newer = ""
+
+    table = bigquery.Table(table_id, schema=schema + [bigquery.SchemaField("extractedDate", "DATE", mode="NULLABLE")])
+    table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field="extractedDate")
+    table.clustering_fields = ["id"]
+
+    query = f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT * FROM `{staging_id}` staging
+            WHERE id IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY id{latest}) = 1
+        ) S
+        ON T.`id` = S.`id`
+        WHEN MATCHED{newer} THEN
+            UPDATE SET {updates}
+        WHEN NOT MATCHED THEN
+            INSERT ({", ".join(f"`{column}`" for column in columns)}, extractedDate)
+            VALUES ({", ".join(f"S.`{column}`" for column in columns)}, @extracted_date)
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("extracted_date", "DATE", datetime.today().date()),
+    ])
+
+    try:
+        with run_metrics.span("merge", table_id.split(".")[-1]) as span:
+            target = get_bq_client().create_table(table, exists_ok=True)
+            # columns added to the schema since the table was created are added to it before merging
+            missing = [field for field in table.schema if field.name not in {column.name for column in target.schema}]
+            if missing:
+                target.schema = list(target.schema) + missing
+                get_bq_client().update_table(target, ["schema"])
+            merge_job = get_bq_client().query(query, job_config=job_config)
+            merge_job.result()
+            span["records"] = merge_job.num_dml_affected_rows or 0
+            get_bq_client().delete_table(staging_id, not_found_ok=True)
+    except Exception as e:
+        LOGGER.error("[merge_staging_table] Error merging %s into %s: %s", staging_id, table_id, e)
+        return False
+
+    LOGGER.info("[merge_staging_table] Merged %s rows from %s into %s", merge_job.num_dml_affected_rows, staging_id, table_id)
+    return True
+
+def load_job_config(schema: list[bigquery.SchemaField], file: str,
+                    write_disposition: str = bigquery.WriteDisposition.WRITE_APPEND) -> bigquery.LoadJobConfig:
+    """
+    Build the configuration of a job loading a staging file into a table.
+    Args:
+        schema: a list of the table schema in Bigquery
+        file: path or name of the staging file, its extension gives the source format
+        write_disposition: whether to append to the table or replace its content
+    Returns:
+        the load job configuration
+    """
+    return bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=staging_source_format(file),
+        write_disposition=write_disposition,
+        create_disposition=bigquery.CreateDisposition.CREATE_IF_NEEDED,
+        # a shard created earlier in the day gets the columns added to the schema since
+        schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+            if write_disposition == bigquery.WriteDisposition.WRITE_APPEND else None,
+        max_bad_records=10
+    )
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def stage_file_in_gcs(file: str) -> str:
+    """
+    Upload a staging file to the BQ_STAGING_DIRECTORY of the bucket.
+    Args:
+        file: path to the staging file
+    Returns:
+        the gs:// uri of the uploaded file
+    """
+    gcs_writer.upload_file(file, BQ_STAGING_DIRECTORY)
+    return f"gs://{gcs_bucket_name}/{gcs_writer.prepare(BQ_STAGING_DIRECTORY)}{os.path.basename(file)}"
+
+def submit_load_job(table_id: str, schema: list[bigquery.SchemaField], file: str) -> bigquery.LoadJob | None:
+    """
+    Stage a file in GCS and start a job loading it into the day's table (or staging table in merge mode),
+    without waiting for it.
+    Args:
+        table_id: the id of the table in Bigquery
+        schema: a list of the table schema in Bigquery
+        file: path to the staging file containing the data to insert
+    Returns:
+        the running load job, or None if the file could not be staged or the job not started
+    """
+    try:
+        uri = stage_file_in_gcs(file)
+    except Exception as e:
+        LOGGER.error("[submit_load_job] Error staging %s: %s", file, e)
+        return None
+    return submit_uri_load_job(table_id, schema, [uri])
+
+def submit_uri_load_job(table_id: str, schema: list[bigquery.SchemaField], uris: list[str],
+                        write_disposition: str | None = None) -> bigquery.LoadJob | None:
+    """
+    Start a job loading files staged in GCS into the day's table (or staging table in merge mode), without waiting for it.
+    Args:
+        table_id: the id of the table in Bigquery
+        schema: a list of the table schema in Bigquery
+        uris: the gs:// uris of the staged files, all in the same format
+        write_disposition: overrides the disposition of the destination, see load_destination
+    Returns:
+        the running load job, or None if the job could not be started
+    """
+    destination, default_disposition = load_destination(table_id)
+    try:
+        load_job = get_bq_client().load_table_from_uri(
+            uris, destination, job_config=load_job_config(schema, uris[0], write_disposition or default_disposition))
+    except Exception as e:
+        LOGGER.error("[submit_uri_load_job] Error starting load job for %s: %s", destination, e)
+        return None
+
+    LOGGER.info("[submit_uri_load_job] Started load job %s from %d files into %s", load_job.job_id, len(uris), destination)
+    return load_job
+
+def wait_for_load_jobs(load_jobs: dict[str, bigquery.LoadJob]) -> dict[str, dict[str, Any]]:
+    """
+    Wait for load jobs running in parallel and report how each went. The staged files of
+    successful jobs are deleted from GCS.
+    Args:
+        load_jobs: the running load jobs keyed by pipeline name.
+    Returns:
+        whether each job succeeded, its duration in seconds, bytes and rows loaded and bad record count,
+        keyed by pipeline name.
+    """
+    results: dict[str, dict[str, Any]] = {}
+    for name, load_job in load_jobs.items():
+        succeeded = True
+        try:
+            load_job.result()
+        except Exception as e:
+            LOGGER.error("[wait_for_load_jobs] Load job for %s failed/did not complete: %s", name, e)
+            succeeded = False
+
+        results[name] = {
+            "succeeded": succeeded,
+            "seconds": (load_job.ended - load_job.started).total_seconds() if load_job.started and load_job.ended else 0.0,
+            "input_bytes": load_job.input_file_bytes or 0,
+            "output_bytes": load_job.output_bytes or 0,
+            "output_rows": load_job.output_rows or 0,
+            "bad_records": len(load_job.errors or []),
+        }
+        LOGGER.info("[wait_for_load_jobs] %s: %s", load_job.destination.table_id if load_job.destination else name, results[name])
+        run_metrics.observe("load_job", results[name]["seconds"], name, not succeeded,
+                            bytes=results[name]["input_bytes"], records=results[name]["output_rows"])
+
+        if succeeded:
+            for uri in load_job.source_uris or []:
+                try:
+                    get_gcs_bucket().blob(uri.removeprefix(f"gs://{gcs_bucket_name}/")).delete()
+                except Exception as e:
+                    LOGGER.warning("[wait_for_load_jobs] Could not delete staged file %s: %s", uri, e)
+    return results
+
+class PartLoader:
+    """
+    Takes the staging parts of a pipeline as a SpoolingWriter completes them. With BQ_LOAD_MODE=file each part is
+    loaded on a background thread, in order, and the cursors of its pages are checkpointed once it is in the table;
+    with BQ_LOAD_MODE=gcs each part is staged in GCS and a single job loads them all at the end.
+    Local parts are deleted as soon as they are loaded or staged. After a part fails the following ones are
+    deleted without being loaded, so the checkpointed cursor never skips data that is missing from the table,
+    and the extraction is stopped, see raise_if_failed.
+    """
+    def __init__(self, name: str, resumed: bool = False):
+        self.name = name
+        self.table_id = pipeline_table_id(name)
+        self.schema = RESOURCE_PIPELINES[name]["schema"]
+        self.uris: list[str] = []
+        self.loaded_parts = 0
+        self.failed = False
+        # a resumed run appends to the staging table the parts loaded by the failed run
+        self._append = resumed
+        self._futures: list[concurrent.futures.Future] = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, file_path: str, cursors: dict[str, str]) -> None:
+        """
+        Queue a completed part to be loaded.
+        Args:
+            file_path: the path of the part.
+            cursors: the cursor of the next page of each resource type, once the part is loaded.
+        """
+        self._futures.append(self._executor.submit(self._load, file_path, cursors))
+
+    def _load(self, file_path: str, cursors: dict[str, str]) -> None:
+        if self.failed:
+            os.remove(file_path)
+            return
+        try:
+            if BQ_LOAD_MODE == "gcs":
+                self.uris.append(stage_file_in_gcs(file_path))
+            else:
+                destination, write_disposition = load_destination(self.table_id)
+                if self._append or self.loaded_parts:
+                    write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+                if not load_staging_file(self.table_id, self.schema, file_path, destination, write_disposition):
+                    raise RuntimeError(f"load of {file_path} into {destination} failed")
+                for resource_type, cursor in cursors.items():
+                    checkpoint_store.advance(resource_type, cursor, loaded=True)
+            self.loaded_parts += 1
+            os.remove(file_path)
+        except Exception as e:
+            self.failed = True
+            LOGGER.error("[PartLoader] Error loading part %s of %s, not loading the following parts: %s", file_path, self.name, e)
+
+    def raise_if_failed(self) -> None:
+        """
+        Stop the extraction feeding the loader once a part failed, the following parts would not be loaded.
+        Raises:
+            RuntimeError: if a part failed to load.
+        """
+        if self.failed:
+            raise RuntimeError(f"a staging part of {self.name} failed to load, not fetching the rest of it")
+
+    def wait(self) -> None:
+        """Wait for the parts submitted so far to be loaded, staged or, after a failure, deleted."""
+        concurrent.futures.wait(self._futures)
+        self._executor.shutdown()
+
+    def finish(self, load_jobs: dict[str, bigquery.LoadJob] | None = None) -> bool:
+        """
+        Wait for the parts to be loaded or staged, then merge them in merge mode, or with BQ_LOAD_MODE=gcs
+        start the job loading them all and add it to load_jobs.
+        Args:
+            load_jobs: the running load jobs of the run, required with BQ_LOAD_MODE=gcs.
+        Returns:
+            True if every part was loaded (or, with BQ_LOAD_MODE=gcs, its load job started), otherwise False
+        """
+        self.wait()
+        if self.failed:
+            return False
+
+        if BQ_LOAD_MODE == "gcs":
+            if not self.uris:
+                return True
+            load_job = submit_uri_load_job(self.table_id, self.schema, self.uris,
+                                           bigquery.WriteDisposition.WRITE_APPEND if self._append else None)
+            if load_job is None:
+                return False
+            load_jobs[self.name] = load_job
+            return True
+
+        LOGGER.info("[PartLoader] Loaded %d parts of %s", self.loaded_parts, self.name)
+        # a resumed run also merges the parts the failed run loaded into the staging table
+        if BQ_WRITE_MODE == "merge" and (self.loaded_parts or self._append):
+            return merge_staging_table(self.table_id, self.schema)
+        return True
+
+class RecordSink(abc.ABC):
+    """
+    Receives the cleaned records of a table as pages arrive, buffering them into appends of BQ_SINK_BATCH_SIZE records.
+    Subclasses send each batch somewhere in _send_batch.
+    """
+    def __init__(self, table_id: str, schema: list[bigquery.SchemaField]):
+        self.table_id = table_id
+        self.schema = schema
+        self.appended = 0
+        self._rows: list[dict[str, Any]] = []
+
+    def append(self, records: list[dict[str, Any]]) -> None:
+        """
+        Add records to the sink, sending a batch whenever enough are buffered.
+        Args:
+            records: the cleaned records.
+        """
+        for item in records:
+            # only STRING columns take the JSON encoding of nested fields, like the columnar staging files
+            self._rows.append({
+                field.name: staging_value(item.get(field.name)) if field.field_type == "STRING" else item.get(field.name)
+                for field in self.schema
+            })
+            if len(self._rows) >= BQ_SINK_BATCH_SIZE:
+                self.flush()
+
+    def flush(self) -> None:
+        """Send the buffered records."""
+        if self._rows:
+            with run_metrics.span("sink_append", self.table_id.split(".")[-1]) as span:
+                self._send_batch(self._rows)
+                span["records"] = len(self._rows)
+            self.appended += len(self._rows)
+            self._rows = []
+
+    def close(self) -> None:
+        """Send the buffered records and wait until every batch is written."""
+        self.flush()
+
+    @abc.abstractmethod
+    def _send_batch(self, rows: list[dict[str, Any]]) -> None:
+        """
+        Send a batch of rows to the table.
+        Args:
+            rows: the rows, keyed by the column names of the schema.
+        """
+
+class InMemorySink(RecordSink):
+    """Fake sink keeping the appended batches in memory, per table, for tests and benchmarks."""
+    batches: dict[str, list[list[dict[str, Any]]]] = {}
+    _lock = threading.Lock()
+
+    def _send_batch(self, rows: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self.batches.setdefault(self.table_id, []).append(list(rows))
+
+class StorageWriteSink(RecordSink):
+    """
+    Appends records to a table through the default stream of the BigQuery Storage Write API, so they are
+    queryable as soon as each append is acknowledged. Rows are sent as protocol buffers built from the table schema.
+    """
+    proto_types = {"STRING": 9, "INTEGER": 3, "INT64": 3, "FLOAT": 1, "FLOAT64": 1, "BOOLEAN": 8, "BOOL": 8}
+
+    def __init__(self, table_id: str, schema: list[bigquery.SchemaField]):
+        try:
+            from google.cloud import bigquery_storage_v1
+            from google.cloud.bigquery_storage_v1 import types, writer
+            from google.protobuf import descriptor_pb2
+        except ImportError as e:
+            raise RuntimeError("BQ_SINK=storage-write requires the google-cloud-bigquery-storage package") from e
+
+        super().__init__(table_id, schema)
+        # the default stream only writes to existing tables
+        get_bq_client().create_table(bigquery.Table(table_id, schema=schema), exists_ok=True)
+
+        self._row_class = self.row_class(schema)
+        self._types = types
+
+        proto_descriptor = descriptor_pb2.DescriptorProto()
+        self._row_class.DESCRIPTOR.CopyToProto(proto_descriptor)
+        project, dataset, table = table_id.split(".")
+        write_client = bigquery_storage_v1.BigQueryWriteClient()
+        request_template = types.AppendRowsRequest(
+            write_stream=f"{write_client.table_path(project, dataset, table)}/streams/_default",
+            proto_rows=types.AppendRowsRequest.ProtoData(writer_schema=types.ProtoSchema(proto_descriptor=proto_descriptor)),
+        )
+        self._stream = writer.AppendRowsStream(write_client, request_template)
+        self._futures: list[Any] = []
+
+    @classmethod
+    def row_class(cls, schema: list[bigquery.SchemaField]) -> type:
+        """
+        Build the protocol buffer message the rows of a table are sent as, one optional field per column.
+        Args:
+            schema: the BigQuery schema of the table.
+        Returns:
+            the message class.
+        """
+        from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+        file_proto = descriptor_pb2.FileDescriptorProto(name="confluence_row.proto", package="confluence", syntax="proto2")
+        message_proto = file_proto.message_type.add(name="Row")
+        for number, field in enumerate(schema, start=1):
+            message_proto.field.add(name=field.name, number=number, label=1, type=cls.proto_types.get(field.field_type, 9))
+        pool = descriptor_pool.DescriptorPool()
+        pool.Add(file_proto)
+        return message_factory.GetMessageClass(pool.FindMessageTypeByName("confluence.Row"))
+
+    @staticmethod
+    def serialize_row(row_class: type, row: dict[str, Any]) -> bytes:
+        """
+        Encode a row of the sink as a protocol buffer message, leaving its NULL columns unset.
+        Args:
+            row_class: the message class of the table, see row_class.
+            row: the row, keyed by the column names of the schema.
+        Returns:
+            the serialized message.
+        """
+        return row_class(**{key: value for key, value in row.items() if value is not None}).SerializeToString()
+
+    def _send_batch(self, rows: list[dict[str, Any]]) -> None:
+        proto_rows = self._types.ProtoRows(serialized_rows=[self.serialize_row(self._row_class, row) for row in rows])
+        self._futures.append(self._stream.send(self._types.AppendRowsRequest(
+            proto_rows=self._types.AppendRowsRequest.ProtoData(rows=proto_rows))))
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            for future in self._futures:
+                future.result()
+        finally:
+            self._stream.close()
+        LOGGER.info("[StorageWriteSink] Appended %d records to %s", self.appended, self.table_id)
+
+RECORD_SINKS: dict[str, type[RecordSink]] = {
+    "storage-write": StorageWriteSink,
+    "memory": InMemorySink,
+}
+
+def open_record_sink(name: str) -> RecordSink | None:
+    """
+    Open the BQ_SINK sink writing a pipeline's records to the day's table.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES, also used as the table name.
+    Returns:
+        the sink, or None if records are loaded from staging files instead.
+    """
+    if not BQ_SINK:
+        return None
+    table_id = f"{pipeline_table_id(name)}_{datetime.today().strftime("%Y%m%d")}"
+    return RECORD_SINKS[BQ_SINK](table_id, RESOURCE_PIPELINES[name]["schema"])
+
+def pipeline_table_id(name: str) -> str:
+    """
+    Get the id of the BigQuery table a pipeline is loaded into, without the date suffix.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES.
+    Returns:
+        the table id.
+    """
+    return f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.{name}"
+
+def commit_pipeline_checkpoints(name: str) -> None:
+    """
+    Move the watermark of every resource type of a pipeline once its data is loaded.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES.
+    """
+    for resource_type in RESOURCE_PIPELINES[name]["resources"]:
+        checkpoint_store.commit(resource_type)
+    response_cache.commit(name)
+
+def api_request_params(resource_type: str, since: str | None = None) -> dict[str, Any]:
+    """
+    Build the query parameters used to page through a Confluence API resource.
+    Args:
+        resource_type: the type of resource to get
+        since: ISO timestamp of the oldest modification to fetch, defaults to the start of yesterday
+    Returns:
+        the query parameters of the first page
+    """
+    if since is None:
+        yesterday = datetime.today() - timedelta(days=1)
+        lastmodified = yesterday.strftime("%Y/%m/%d")
+    else:
+        window_start = datetime.fromisoformat(since).strftime("%Y/%m/%d %H:%M")
+        lastmodified = f'"{window_start}"'
+    return {
         "limit": 250,
-        "cql": f"lastmodified >= {yesterday.strftime("%Y/%m/%d")}"
+        "cql": f"lastmodified >= {lastmodified}"
     }
+
+def next_page_cursor(response: dict[str, Any]) -> str:
+    """
+    Extract the cursor of the next page from a Confluence API response.
+    Args:
+        response: the decoded JSON body of a page of results
+    Returns:
+        the cursor of the next page, or an empty string on the last page
+    """
+    if response.get("_links") and response["_links"].get("next"):
+        # next page cursor is stored in _links["next"] attribute and has the following format:
+        # wiki/api/v2/{resource_type}?cursor=eyJpZCI6IjYxOTc0MTM0MCIsImNvbnRlbnRPcmRlciI6ImlkIiwiY29udGVudE9yZGVyVmFsdWUiOjYxOTc0MTM0MH0=&limit=25
+        link_params = response["_links"]["next"].split("?")[1].split("&")
+        for item in link_params:
+            if item.startswith("cursor="):
+                return item.removeprefix("cursor=")
+    return ""
+
+def iter_api_pages(resource_type: str, since: str | None = None, cursor: str = "",
+                   on_page_done: Callable[[str], None] | None = None) -> Iterator[list[dict[str, Any]]]:
+    """
+    Page through a Confluence API resource, yielding the results of each page as it arrives.
+    In space pagination mode, resources with a per-space endpoint are paged through every space at once,
+    unless a cursor left by an earlier serial run is being resumed.
+    Args:
+        resource_type: the type of resource to get
+        since: ISO timestamp of the oldest modification to fetch, defaults to the start of yesterday
+        cursor: the cursor of the page to start from, empty to start from the first page
+        on_page_done: called with the cursor of the next page once the consumer is done with a page
+    Yields:
+        the records of one page of results
+    """
+    params = api_request_params(resource_type, since)
     raw_url = RESOURCE_TYPES.get(resource_type)
     if not raw_url:
         LOGGER.error("unknown recource type passed")
-        return None
+        return
 
-    url = raw_url.format(url=os.getenv("BASE_URL"))
+    if PAGINATION_MODE == "space" and resource_type in SPACE_RESOURCE_TYPES and not cursor:
+        yield from iter_space_pages(resource_type, params, on_page_done)
+        return
+
+    yield from iter_cursor_pages(raw_url.format(url=os.getenv("BASE_URL")), params, resource_type, cursor, on_page_done)
+
+def iter_cursor_pages(url: str, params: dict[str, Any], resource_type: str, cursor: str = "",
+                      on_page_done: Callable[[str], None] | None = None, conditional: bool = True) -> Iterator[list[dict[str, Any]]]:
+    """
+    Follow the cursor chain of a Confluence API endpoint, yielding the results of each page as it arrives.
+    Args:
+        url: the url of the endpoint.
+        params: the query parameters of the first page, updated with the cursor of each page.
+        resource_type: the type of resource, used to attribute the metrics.
+        cursor: the cursor of the page to start from, empty to start from the first page
+        on_page_done: called with the cursor of the next page once the consumer is done with a page
+        conditional: whether the pages are requested conditionally through the response cache
+    Yields:
+        the records of one page of results
+    """
+    finished = False
+    next_cursor = cursor
+    headers = {
+        "Accept": "application/json"
+    }
 
-    data: list[dict[str, Any]] = []
     while not finished:
         if next_cursor:
             params["cursor"] = next_cursor
 
-        response = requests.get(url, params=params, headers=headers, auth=auth_token, timeout=15).json()
-        data.extend(response.get("results", []))
-        
-        if response.get("_links") and response["_links"].get("next"):
-            # next page cursor is stored in _links["next"] attribute and has the following format:
-            # wiki/api/v2/{resource_type}?cursor=eyJpZCI6IjYxOTc0MTM0MCIsImNvbnRlbnRPcmRlciI6ImlkIiwiY29udGVudE9yZGVyVmFsdWUiOjYxOTc0MTM0MH0=&limit=25
-            link_params = response["_links"]["next"].split("?")[1].split("&")
-            for item in link_params:
-                if item.startswith("cursor="):
-                    next_cursor = item.removeprefix("cursor=")
-                    break
-        else:
-            finished = True
+        response = get_api_page(url, params, headers, resource_type, conditional)
+        yield response.get("results", [])
+
+        next_cursor = next_page_cursor(response)
+        finished = not next_cursor
+        if on_page_done:
+            on_page_done(next_cursor)
+
+def list_space_ids() -> list[str]:
+    """
+    List the ids of every space of the site, once per run.
+    Returns:
+        the space ids.
+    """
+    global _space_ids
+    with _space_ids_lock:
+        if _space_ids is None:
+            url = RESOURCE_TYPES["spaces"].format(url=os.getenv("BASE_URL"))
+            space_ids = []
+            # the listing shares the request of the spaces pipeline's first page, it never uses the pipeline's cache
+            for page in iter_cursor_pages(url, {"limit": 250}, "spaces", conditional=False):
+                reference_index.add("spaces", page)
+                space_ids.extend(space["id"] for space in page)
+            # only a complete list is kept, a failed listing is tried again by the next pipeline
+            _space_ids = space_ids
+            LOGGER.info("[list_space_ids] Found %d spaces", len(_space_ids))
+        return _space_ids
+
+def iter_space_pages(resource_type: str, params: dict[str, Any],
+                     on_page_done: Callable[[str], None] | None = None) -> Iterator[list[dict[str, Any]]]:
+    """
+    Page through the per-space endpoint of a resource type for every space, SPACE_FANOUT_WORKERS spaces at a time,
+    yielding the pages of all spaces as they arrive. The cursors of the spaces are not checkpointed, so on_page_done
+    is only told that the resource is done once every space is, and a failed run starts the resource again.
+    Args:
+        resource_type: the type of resource, a key of SPACE_RESOURCE_TYPES.
+        params: the query parameters of the first page of each space.
+        on_page_done: called with an empty cursor once the pages of every space were consumed.
+    Yields:
+        the records of one page of results, from any space.
+    Raises:
+        Exception: the error of the first space that failed, once the pages received before it were consumed.
+    """
+    pages: queue.Queue = queue.Queue(maxsize=SPACE_FANOUT_WORKERS * 2)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        # gives up once the consumer is gone, instead of blocking on a queue nobody reads
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def space_worker(space_id: str) -> None:
+        url = SPACE_RESOURCE_TYPES[resource_type].format(url=os.getenv("BASE_URL"), space_id=space_id)
+        try:
+            for page in iter_cursor_pages(url, dict(params), resource_type):
+                if not put(page):
+                    return
+            put(_QUEUE_DONE)
+        except Exception as e:
+            put(e)
+
+    space_ids = list_space_ids()
+    space_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SPACE_FANOUT_WORKERS)
+    try:
+        for space_id in space_ids:
+            space_executor.submit(space_worker, space_id)
+        remaining = len(space_ids)
+        while remaining:
+            page = pages.get()
+            if page is _QUEUE_DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # the spaces not started yet are dropped, the running ones stop at their next page
+        stop.set()
+        space_executor.shutdown(wait=True, cancel_futures=True)
+
+    if on_page_done:
+        on_page_done("")
+
+def not_modified_page(url: str, cached_page: dict[str, Any] | None) -> dict[str, Any]:
+    """
+    Get the page to use for a 304 Not Modified response: the body cached by the run that fetched it.
+    Args:
+        url: the url of the resource.
+        cached_page: the cached body of the page, None if the request was sent without validators.
+    Returns:
+        the cached body of the page.
+    Raises:
+        RuntimeError: if there is no cached body, an empty page would make the pipeline load nothing and commit its watermark.
+    """
+    if cached_page is None:
+        raise RuntimeError(f"{url} answered 304 Not Modified to a request without cached validators")
+    return cached_page
+
+def get_api_page(url: str, params: dict[str, Any], headers: dict[str, str], resource_type: str,
+                 conditional: bool = True) -> dict[str, Any]:
+    """
+    Request one page of a Confluence API resource, retrying just this request when it fails.
+    Throttled (429/503) and server error responses are retried after their Retry-After, or a random
+    exponential backoff, and throttling slows down every request to the host.
+    Args:
+        url: the url of the resource.
+        params: the query parameters of the page.
+        headers: the request headers.
+        resource_type: the type of resource, used to attribute the metrics.
+        conditional: whether to send the validators of the cached page and replay its body when it is not modified.
+    Returns:
+        the decoded JSON body of the page.
+    Raises:
+        requests.exceptions.RequestException: if the request is rejected or still fails after API_MAX_ATTEMPTS attempts.
+        RuntimeError: if the API answers 304 Not Modified for a page that is not cached.
+    """
+    rate_limiter = host_rate_limiter(url)
+    validators, cached_page = response_cache.page_validators(url, params) if conditional else ({}, None)
+    with run_metrics.span("api_page", resource_type) as span:
+        for attempt in range(1, API_MAX_ATTEMPTS + 1):
+            retry_after = None
+            rate_limiter.acquire()
+            try:
+                with host_request_slot(url):
+                    response = get_http_session().get(url, params=params, headers={**headers, **validators}, timeout=15)
+                record_api_metrics(resource_type, requests=1)
+                if response.status_code == 304:
+                    rate_limiter.on_success()
+                    record_api_metrics(resource_type, not_modified=1)
+                    return not_modified_page(url, cached_page)
+                if response.status_code in (429, 503):
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    rate_limiter.on_throttle(retry_after)
+                    record_api_metrics(resource_type, throttled=1)
+                response.raise_for_status()
+                payload = response.json()
+                rate_limiter.on_success()
+                if conditional:
+                    response_cache.record_page(url, params, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                                               response.content)
+                span["bytes"] = len(response.content)
+                span["records"] = len(payload.get("results", []))
+                return payload
+            except (requests.exceptions.RequestException, ValueError) as e:
+                status = getattr(getattr(e, "response", None), "status_code", None)
+                if attempt == API_MAX_ATTEMPTS or (status is not None and status < 500 and status != 429):
+                    raise
+                delay = retry_delay(attempt, retry_after)
+                LOGGER.warning("[get_api_page] Attempt %d for %s failed, retrying in %.1fs: %s", attempt, resource_type, delay, e)
+                record_api_metrics(resource_type, retries=1, retry_wait_seconds=delay)
+                span["retries"] += 1
+                if retry_after is None:
+                    # otherwise the rate limiter holds the next request until the Retry-After expires
+                    time.sleep(delay)
+
+def make_api_request(resource_type: str, since: str | None = None) -> list[dict[str, Any]] | None:
+    """
+    Make an API request to Confluence API
+    Args:
+        resource_type: the type of resource to get
+        since: ISO timestamp of the oldest modification to fetch, defaults to the start of yesterday
+    Returns:
+        all the records of the resource, or None if the resource type is unknown
+    """
+    if resource_type not in RESOURCE_TYPES:
+        LOGGER.error("unknown recource type passed")
+        return None
+
+    data: list[dict[str, Any]] = []
+    for page in iter_api_pages(resource_type, since):
+        data.extend(page)
 
     return data
 
-def clean_data(raw_data: list[dict[str, Any]], category: str = "data") -> list[dict[str, Any]]:
+def stream_resource_to_staging_file(name: str, sink: RecordSink | None = None) -> tuple[str | None, int]:
     """
-    Start threads to clean the raw data submitted.
+    Clean every page of a pipeline's resources as it arrives and append it to the day's staging file,
+    so only one page of records is held in memory at a time.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES.
+        sink: when given, each page is also appended to the sink as it arrives.
+    Returns:
+        the path to the staging file (None if there were no records) and the number of records written.
+    """
+    pipeline = RESOURCE_PIPELINES[name]
+    file_path = staging_file_path(name)
+    written = 0
+
+    # pages written to a JSONL file by a previous attempt are kept and pagination resumes after them,
+    # columnar files can't be appended to once closed so they are written again from the first page
+    pending = [checkpoint_store.begin(resource_type) for resource_type in pipeline["resources"]]
+    resume = STAGING_FORMAT == "jsonl" and os.path.exists(file_path) and any(checkpoint["cursor"] or checkpoint["done"] for checkpoint in pending)
+    if resume:
+        with open(file_path, "r", encoding="utf-8") as fp:
+            written = sum(1 for _ in fp)
+        LOGGER.info("[stream_resource_to_staging_file] Resuming %s after %d records", name, written)
+    else:
+        for resource_type in pipeline["resources"]:
+            checkpoint_store.restart(resource_type)
+
+    writer = open_staging_writer(name, pipeline["schema"], append=resume)
+
+    def page_done(resource_type: str, cursor: str) -> None:
+        # the page reaches the file before its cursor is checkpointed, so a crash never skips it on resume
+        writer.flush()
+        checkpoint_store.advance(resource_type, cursor)
+
+    try:
+        for resource_type in pipeline["resources"]:
+            checkpoint = checkpoint_store.begin(resource_type)
+            if checkpoint["done"]:
+                continue
+            for page in iter_api_pages(resource_type, checkpoint["since"], checkpoint["cursor"],
+                                       on_page_done=lambda cursor, resource_type=resource_type: page_done(resource_type, cursor)):
+                if page:
+                    records = clean_data(page, name)
+                    with run_metrics.span("staging_write", name) as span:
+                        span["records"] = writer.write(records)
+                    written += span["records"]
+                    if sink:
+                        sink.append(records)
+                    LOGGER.info("[stream_resource_to_staging_file] Records written so far for %s: %d", name, written)
+    finally:
+        writer.close()
+        if sink:
+            sink.close()
+
+    if not written:
+        os.remove(file_path)
+        LOGGER.info("[stream_resource_to_staging_file] No data for %s to write", name)
+        return None, 0
+
+    LOGGER.info("[stream_resource_to_staging_file] Written %d records to %s", written, file_path)
+    return file_path, written
+
+def start_spooling(name: str) -> tuple["PartLoader", SpoolingWriter]:
+    """
+    Prepare to spool a pipeline's records to staging parts: delete the parts a failed run left behind, then resume
+    after the parts it loaded or restart the checkpoints of the pipeline's resources.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES.
+    Returns:
+        the loader of the parts and the writer handing them over to it.
+    """
+    pipeline = RESOURCE_PIPELINES[name]
+    remove_staging_parts(name)
+    pending = [checkpoint_store.begin(resource_type) for resource_type in pipeline["resources"]]
+    # parts staged in GCS are only loaded at the end, so a failed gcs run starts over
+    resumed = BQ_LOAD_MODE == "file" and any(checkpoint["cursor"] or checkpoint["done"] for checkpoint in pending)
+    if resumed:
+        LOGGER.info("[start_spooling] Resuming %s after the parts loaded by a previous attempt", name)
+    else:
+        for resource_type in pipeline["resources"]:
+            checkpoint_store.restart(resource_type)
+
+    loader = PartLoader(name, resumed)
+    return loader, SpoolingWriter(name, pipeline["schema"], loader.submit)
+
+def spool_resource_to_bq(name: str, load_jobs: dict[str, bigquery.LoadJob] | None = None) -> tuple[bool, int]:
+    """
+    Clean every page of a pipeline's resources as it arrives and write it to staging parts of STAGING_PART_SIZE bytes,
+    each loaded (or staged in GCS) and deleted as soon as it is complete, while the next part is written.
+    Pagination resumes after the last part loaded by a failed run, the parts it had not loaded are fetched again.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES.
+        load_jobs: the running load jobs of the run, required with BQ_LOAD_MODE=gcs.
+    Returns:
+        whether every part was loaded, and the number of records written.
+    """
+    pipeline = RESOURCE_PIPELINES[name]
+    written = 0
+
+    loader, writer = start_spooling(name)
+    try:
+        for resource_type in pipeline["resources"]:
+            checkpoint = checkpoint_store.begin(resource_type)
+            if checkpoint["done"]:
+                continue
+            for page in iter_api_pages(resource_type, checkpoint["since"], checkpoint["cursor"],
+                                       on_page_done=lambda cursor, resource_type=resource_type: writer.mark_page(resource_type, cursor)):
+                loader.raise_if_failed()
+                if page:
+                    records = clean_data(page, name)
+                    with run_metrics.span("staging_write", name) as span:
+                        span["records"] = writer.write(records)
+                    written += span["records"]
+                    LOGGER.info("[spool_resource_to_bq] Records written so far for %s: %d in %d parts", name, written, writer.parts)
+    finally:
+        writer.close()
+        # a failed extraction still waits for the parts handed over, so they are not loaded behind the next attempt's back
+        loader.wait()
+
+    loaded = loader.finish(load_jobs)
+    LOGGER.info("[spool_resource_to_bq] Written %d records of %s to %d parts, loaded: %s", written, name, writer.parts, loaded)
+    return loaded, written
+
+def clean_data(raw_data: list[dict[str, Any]], name: str) -> list[dict[str, Any]]:
+    """
+    Clean the raw data of a pipeline, in chunks of CLEAN_CHUNK_SIZE records spread over the cleaning pool.
+    Records whose version was already loaded by an earlier run are dropped first, see ResponseCache,
+    and the cleaned records get the titles and space keys of the records they reference, see ReferenceIndex.
+    Attachments are cleaned in the calling thread, their downloads and uploads run on their own thread pools.
     Args:
         raw_data: the raw data to be processed
-        category: the categore of the passed in data. Can be 'data' or 'attachments'
+        name: the key of the pipeline in RESOURCE_PIPELINES the data belongs to
     Return:
         returns a list of dicts containing the cleaned version of the passed in data
     """
-    cleaned_data: list[dict[str, Any]] = []
-    ranges = []
-    max_workers = 0
-    part_size = 0
-
-    if len(raw_data) > 500:
-        if len(raw_data) < 2000:
-            max_workers = 2
-        elif len(raw_data) < 5000:
-            max_workers = 4
-        elif len(raw_data) < 8000:
-            max_workers = 6
-        else:
-            max_workers = 10
-        part_size = len(raw_data) / max_workers
-    else:
-        max_workers = 1
-        part_size = len(raw_data)
-
-    for i in range(max_workers):
-        start = int(i * part_size)
-        end = int((i + 1) * part_size)
-        ranges.append((start, end))
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as thread_exececutor:
-        if category == "attachments":
-            futures = [thread_exececutor.submit(process_attachments, raw_data[start:end]) for start, end in ranges]
+    pipeline = RESOURCE_PIPELINES[name]
+    reference_index.add(name, raw_data)
+    raw_data = response_cache.changed(name, raw_data)
+    if pipeline["category"] == "attachments":
+        cleaned_data = process_attachments(raw_data, pipeline["schema"])
+        reference_index.enrich(name, cleaned_data)
+        return cleaned_data
+
+    with run_metrics.span("clean", name) as span:
+        span["records"] = len(raw_data)
+        pool = cleaning_pool() if len(raw_data) > CLEAN_CHUNK_SIZE else None
+        if pool is None:
+            cleaned_data = process_data(raw_data, pipeline["schema"])
         else:
-            futures = [thread_exececutor.submit(process_data, raw_data[start:end]) for start, end in ranges]
-        
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                cleaned_data.extend(future.result(timeout=300))
+            cleaned_data = []
+            for chunk in pool.map_chunks(clean_chunk, raw_data, CLEAN_CHUNK_SIZE, name):
+                cleaned_data.extend(chunk)
                 LOGGER.info("[clean_data] Records cleaned so far: %d", len(cleaned_data))
-            except Exception as e:
-                LOGGER.error("[clean_data] Error cleaning data: %s", e)
-                continue
 
+    # bodies are uploaded from this process, the cleaning workers don't share the GCS client or the body index
+    offload_bodies(cleaned_data, name)
+    reference_index.enrich(name, cleaned_data)
     return cleaned_data
 
-def process_data(raw_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+def clean_chunk(name: str, raw_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
     """
-    Cleans the input data by emoving unnecessary fields or stringifying nested fields
+    Clean a chunk of a pipeline's records on a worker of the cleaning pool.
+    Only the pipeline name is sent with the chunk, the worker finds the schema itself.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES the data belongs to
+        raw_data: the raw records of the chunk
+    Returns:
+        the cleaned records
+    """
+    return process_data(raw_data, RESOURCE_PIPELINES[name]["schema"])
+
+class RecordTransformer:
+    """
+    Cleans the raw records of a table in a single pass, compiled once from the table schema.
+    Only the schema columns are kept, nested values of STRING columns (version, properties, body...)
+    are serialized to JSON and missing or null fields are left out.
+    """
+    def __init__(self, schema: list[bigquery.SchemaField]):
+        self.schema = schema
+        self._columns = tuple((field.name, field.field_type == "STRING") for field in schema)
+
+    def transform(self, item: dict[str, Any]) -> dict[str, Any]:
+        """
+        Clean a single record.
+        Args:
+            item: unprocessed extracted record, left unchanged
+        Returns:
+            the processed record
+        """
+        record = {}
+        for column, is_string in self._columns:
+            value = item.get(column)
+            if value is None:
+                continue
+            if is_string and not isinstance(value, str):
+                value = dumps_json(value)
+            record[column] = value
+        return record
+
+_record_transformers: dict[int, RecordTransformer] = {}
+
+def record_transformer(schema: list[bigquery.SchemaField]) -> RecordTransformer:
+    """
+    Get the transformer compiled from a table schema, compiling it on first use.
+    Args:
+        schema: one of the *_table_schema lists.
+    Returns:
+        the transformer shared by every page of the table.
+    """
+    transformer = _record_transformers.get(id(schema))
+    if transformer is None:
+        transformer = _record_transformers.setdefault(id(schema), RecordTransformer(schema))
+    return transformer
+
+def process_data(raw_data: list[dict[str, Any]], schema: list[bigquery.SchemaField]) -> list[dict[str, Any]]:
+    """
+    Cleans the input data by keeping the schema columns and serializing nested fields to JSON
     Args:
         raw_data: unprocessed extracted data
+        schema: the BigQuery schema of the table the data is loaded into
     Returns:
         processed data
     """
-    data = []
-    for item in raw_data:
-        if "_links" in item.keys():
-            del item["_links"]
+    transform = record_transformer(schema).transform
+    return [transform(item) for item in raw_data]
 
-        if "icon" in item.keys():
-            del item["icon"]
+def offload_bodies(records: list[dict[str, Any]], name: str) -> None:
+    """
+    Move the bodies of a pipeline's cleaned records to GCS when BODY_STORAGE=gcs and its table has a bodyUri column.
+    Each body is replaced by its sha256, size in bytes and gs:// uri, and only bodies missing from the body index
+    are compressed and uploaded. A body that fails to upload stays in its row.
+    Args:
+        records: the cleaned records, updated in place.
+        name: the key of the pipeline in RESOURCE_PIPELINES the records belong to.
+    """
+    if BODY_STORAGE != "gcs" or not any(field.name == "bodyUri" for field in RESOURCE_PIPELINES[name]["schema"]):
+        return
+
+    with run_metrics.span("body_offload", name) as span:
+        uploads: dict[str, bytes] = {}
+        offloaded: list[tuple[dict[str, Any], str, int]] = []
+        for item in records:
+            if item.get("body") is None:
+                continue
+            body = item["body"].encode("utf-8")
+            sha256 = hashlib.sha256(body).hexdigest()
+            if sha256 not in uploads and not body_index.seen(sha256):
+                uploads[sha256] = body
+            offloaded.append((item, sha256, len(body)))
+
+        failed: set[str] = set()
+        if uploads:
+            with WorkerPool("thread", min(BODY_UPLOAD_WORKERS, len(uploads))) as upload_pool:
+                futures = {upload_pool.submit(upload_body, sha256, body): sha256 for sha256, body in uploads.items()}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        span["bytes"] += future.result()
+                        body_index.record(futures[future])
+                    except Exception as e:
+                        failed.add(futures[future])
+                        LOGGER.error("[offload_bodies] Error uploading body %s, keeping it inline: %s", futures[future], e)
+
+        for item, sha256, size in offloaded:
+            item["bodySha256"] = sha256
+            item["bodySize"] = size
+            if sha256 not in failed:
+                item["bodyUri"] = body_uri(sha256)
+                del item["body"]
+        span["records"] = len(uploads) - len(failed)
+    LOGGER.info("[offload_bodies] Offloaded %d %s bodies, uploaded %d new ones", len(offloaded), name, span["records"])
+
+def body_uri(sha256: str) -> str:
+    """
+    Get the gs:// uri of an offloaded body.
+    Args:
+        sha256: the hex digest of the body.
+    Returns:
+        the uri of the gzip-compressed body in BODY_GCS_DIRECTORY.
+    """
+    return f"gs://{gcs_bucket_name}/{gcs_writer.prepare(BODY_GCS_DIRECTORY)}{sha256}.json.gz"
 
-        if "version" in item.keys():
-            item["version"] = str(item["version"])
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def upload_body(sha256: str, body: bytes) -> int:
+    """
+    Upload a body to GCS, gzip-compressed and served with Content-Encoding: gzip so readers get it decompressed.
+    Args:
+        sha256: the hex digest of the body, used as the object name.
+        body: the JSON-encoded body.
+    Returns:
+        the number of bytes uploaded.
+    """
+    compressed = gzip.compress(body, compresslevel=6)
+    blob = gcs_writer.new_blob(f"{sha256}.json.gz", BODY_GCS_DIRECTORY)
+    blob.content_encoding = "gzip"
+    started = time.perf_counter()
+    blob.upload_from_string(compressed, content_type="application/json")
+    gcs_writer.record_upload(started, len(compressed))
+    return len(compressed)
+
+def transfer_attachments(items: Iterable[dict[str, Any]], save_dir: str) -> None:
+    """
+    Download attachments and upload them to GCS through two worker pools connected by bounded queues.
+    Items are queued for download as they are produced, the download pool streams each file to disk
+    and queues it for upload, and the upload pool pushes it to GCS and sets the record's gcsLink.
+    A full queue blocks the stage feeding it, so a slow stage throttles the ones before it.
+    Args:
+        items: the cleaned attachment records, updated in place.
+        save_dir: directory where the files are downloaded to.
+    """
+    download_jobs: queue.Queue = queue.Queue(maxsize=ATTACHMENT_QUEUE_SIZE)
+    upload_jobs: queue.Queue = queue.Queue(maxsize=ATTACHMENT_QUEUE_SIZE)
 
-        if "properties" in item.keys():
-            item["properties"] = str(item["properties"])
+    def download_worker() -> None:
+        while (item := download_jobs.get()) is not _QUEUE_DONE:
+            try:
+                if ATTACHMENT_TRANSFER_MODE == "stream":
+                    # the download is piped into the upload, so there is nothing to hand to the upload pool
+                    gcs_link = stream_confluence_file_to_gcs(item["downloadLink"], attachment_object_prefix(item))
+                    if gcs_link:
+                        item["gcsLink"] = gcs_link
+                    continue
+                file_path = download_and_verify_confluence_file(item["downloadLink"], save_dir)
+                if file_path:
+                    upload_jobs.put((item, file_path))
+            except Exception as e:
+                LOGGER.error("[transfer_attachments] Error downloading %s: %s", item.get("id"), e)
 
-        if "body" in item.keys():
-            item["body"] = str(item["body"])
+    def upload_worker() -> None:
+        while (job := upload_jobs.get()) is not _QUEUE_DONE:
+            item, file_path = job
+            try:
+                item["gcsLink"] = gcs_add_file(file_path, object_name=attachment_object_name(item, file_path))
+            except Exception as e:
+                LOGGER.error("[transfer_attachments] Error uploading %s: %s", item.get("id"), e)
 
-        data.append(item)
-    return data
+    with WorkerPool("thread", ATTACHMENT_UPLOAD_WORKERS) as upload_pool, \
+            WorkerPool("thread", ATTACHMENT_DOWNLOAD_WORKERS) as download_pool:
+        uploaders = [upload_pool.submit(upload_worker) for _ in range(ATTACHMENT_UPLOAD_WORKERS)]
+        downloaders = [download_pool.submit(download_worker) for _ in range(ATTACHMENT_DOWNLOAD_WORKERS)]
 
-def process_attachments(raw_data: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        try:
+            for item in items:
+                if "downloadLink" in item.keys():
+                    download_jobs.put(item)
+        finally:
+            for _ in downloaders:
+                download_jobs.put(_QUEUE_DONE)
+            concurrent.futures.wait(downloaders)
+
+            for _ in uploaders:
+                upload_jobs.put(_QUEUE_DONE)
+            concurrent.futures.wait(uploaders)
+
+def process_attachments(raw_data: list[dict[str, Any]], schema: list[bigquery.SchemaField] = attachments_table_schema) -> list[dict[str, Any]]:
     """
-    Cleans input data by removing unnecessary fields or stringifying nested fields.
+    Cleans input data by keeping the schema columns and serializing nested fields to JSON.
     Also downloads and saves attachments to GCS, and includes link to the GCS file in the processed data
     Args:
         raw_data: unprocessed extracted data
+        schema: the BigQuery schema of the table the data is loaded into
     Returns:
         processed data
     """
+    transform = record_transformer(schema).transform
     data = []
+    keys = []
     save_dir = tmp_outpath + "/attachments"
     os.makedirs(save_dir, exist_ok=True)
 
-    for item in raw_data:
-        if "_links" in item.keys():
-            del item["_links"]
+    def cleaned_items() -> Iterator[dict[str, Any]]:
+        for item in raw_data:
+            keys.append(attachment_index_key(item))
+            data.append(transform(item))
+            # unchanged attachments reuse the file uploaded by an earlier run
+            gcs_link = attachment_index.lookup(keys[-1], data[-1].get("fileId"))
+            if gcs_link:
+                data[-1]["gcsLink"] = gcs_link
+                continue
+            yield data[-1]
 
-        if "icon" in item.keys():
-            del item["icon"]
+    transfer_attachments(cleaned_items(), save_dir)
 
-        if "version" in item.keys():
-            item["version"] = str(item["version"])
+    for item, key in zip(data, keys):
+        if item.get("gcsLink"):
+            attachment_index.record(key, item.get("fileId"), item["gcsLink"])
+    return data
 
-        if "properties" in item.keys():
-            item["properties"] = str(item["properties"])
+def run_resource_pipeline(name: str, load_jobs: dict[str, bigquery.LoadJob] | None = None) -> dict[str, float]:
+    """
+    Fetch, clean, write and load a single resource pipeline.
+    Args:
+        name: the key of the pipeline in RESOURCE_PIPELINES, also used as the table name.
+        load_jobs: when given, the staging file is loaded from GCS and the running load job is added to it
+            instead of being waited for; the caller then waits for it and commits the checkpoints.
+    Returns:
+        the time in seconds spent in each stage of the pipeline.
+    """
+    pipeline = RESOURCE_PIPELINES[name]
+    timings: dict[str, float] = {}
+    file_path = None
+    loaded = True
+    sink = open_record_sink(name)
+
+    if EXTRACTION_MODE == "stream" and STAGING_PART_SIZE and not sink:
+        started = time.perf_counter()
+        loaded, written = spool_resource_to_bq(name, load_jobs)
+        reference_index.done(name)
+        timings["extract"] = time.perf_counter() - started
+        LOGGER.info("Fetched %d %s", written, name)
+        # with BQ_LOAD_MODE=gcs the checkpoints are committed once the load job of the parts succeeds
+        if loaded and (load_jobs is None or name not in load_jobs):
+            commit_pipeline_checkpoints(name)
+        return timings
+    elif EXTRACTION_MODE == "stream":
+        started = time.perf_counter()
+        file_path, written = stream_resource_to_staging_file(name, sink)
+        reference_index.done(name)
+        timings["extract"] = time.perf_counter() - started
+        LOGGER.info("Fetched %d %s", written, name)
+    else:
+        started = time.perf_counter()
+        records: list[dict[str, Any]] = []
+        for resource_type in pipeline["resources"]:
+            records.extend(make_api_request(resource_type, checkpoint_store.begin(resource_type)["since"]) or [])
+        timings["fetch"] = time.perf_counter() - started
+        LOGGER.info("Fetched %d %s", len(records), name)
+
+        if records:
+            started = time.perf_counter()
+            records = clean_data(records, name)
+            timings["clean"] = time.perf_counter() - started
+            reference_index.done(name)
+
+            started = time.perf_counter()
+            if sink:
+                try:
+                    sink.append(records)
+                finally:
+                    sink.close()
+                timings["sink"] = time.perf_counter() - started
+            else:
+                file_path = write_staging_file(records, name, pipeline["schema"])
+                timings["write"] = time.perf_counter() - started
+
+    if sink:
+        # the records already reached the table through the sink
+        file_path = None
+
+    if file_path and load_jobs is not None:
+        started = time.perf_counter()
+        load_job = submit_load_job(pipeline_table_id(name), pipeline["schema"], file_path)
+        timings["stage"] = time.perf_counter() - started
+        if load_job:
+            load_jobs[name] = load_job
+        return timings
 
-        if "body" in item.keys():
-            item["body"] = str(item["body"])
-        
-        if "downloadLink" in item.keys():
-            file_path = download_and_verify_confluence_file(item["downloadLink"], save_dir)
-            if file_path:
-                gcs_link = gcs_add_file(file_path)
-                item["gcsLink"] = gcs_link
+    if file_path:
+        started = time.perf_counter()
+        loaded = write_table_to_bq(pipeline_table_id(name), pipeline["schema"], file_path)
+        timings["load"] = time.perf_counter() - started
 
-        data.append(item)
-    return data
+    if loaded:
+        commit_pipeline_checkpoints(name)
+
+    return timings
+
+def finish_load_jobs(load_jobs: dict[str, bigquery.LoadJob], timings: dict[str, dict[str, float]]) -> None:
+    """
+    Wait for the load jobs started by the pipelines and commit the checkpoints of those that succeeded.
+    Args:
+        load_jobs: the running load jobs keyed by pipeline name.
+        timings: the stage timings of each pipeline that completed, the load durations are added to it.
+    """
+    for name, result in wait_for_load_jobs(load_jobs).items():
+        timings.setdefault(name, {})["load"] = result["seconds"]
+        if result["succeeded"] and BQ_WRITE_MODE == "merge":
+            started = time.perf_counter()
+            result["succeeded"] = merge_staging_table(pipeline_table_id(name), RESOURCE_PIPELINES[name]["schema"])
+            timings[name]["merge"] = time.perf_counter() - started
+        if result["succeeded"]:
+            commit_pipeline_checkpoints(name)
+
+def report_run(names: list[str], timings: dict[str, dict[str, float]], seconds: float) -> None:
+    """
+    Log the summary of a run, slowest pipelines and stages first, and export it to the configured metrics files.
+    Args:
+        names: the names of the pipelines the run started.
+        timings: the stage timings of each pipeline that completed, keyed by the pipeline name.
+        seconds: the wall time of the run.
+    """
+    summary = build_run_summary(names, timings, seconds)
+    report_pipeline_timings(timings)
+    for entry in sorted(summary["stages"], key=lambda entry: entry["total_seconds"], reverse=True):
+        LOGGER.info("[report_run] %s%s: count=%d errors=%d total=%.2fs p50=%.3fs p95=%.3fs bytes=%d records=%d retries=%d",
+                    entry["stage"], f"[{entry["resource"]}]" if entry["resource"] else "", entry["count"], entry["errors"],
+                    entry["total_seconds"], entry["p50_seconds"], entry["p95_seconds"], entry["bytes"], entry["records"], entry["retries"])
+    if summary["http"]:
+        LOGGER.info("[report_run] HTTP connection stats: %s", summary["http"])
+    LOGGER.info("[report_run] API request stats: %s", summary["api"])
+    LOGGER.info("[report_run] GCS upload stats: %s", summary["gcs_uploads"])
+    LOGGER.info("[report_run] Finished %d/%d pipelines in %.2fs", len(timings), len(names), seconds)
+    export_run_summary(summary)
+
+def report_pipeline_timings(timings: dict[str, dict[str, float]]) -> None:
+    """
+    Log the time spent by each pipeline, slowest first, so the dominating chain is easy to spot.
+    Args:
+        timings: the stage timings of each pipeline keyed by the pipeline name.
+    """
+    for name, stages in sorted(timings.items(), key=lambda entry: sum(entry[1].values()), reverse=True):
+        breakdown = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in stages.items())
+        LOGGER.info("[report_pipeline_timings] %s: total=%.2fs (%s)", name, sum(stages.values()), breakdown)
+
+def pipeline_run_order(names: list[str]) -> list[str]:
+    """
+    Order pipelines so each one starts after the parents it references, which it waits for while enriching its records.
+    Args:
+        names: the names of the pipelines to run.
+    Returns:
+        the names sorted by depth in the parent graph, in their original order within a depth.
+    """
+    def depth(name: str) -> int:
+        return max((depth(parent) + 1 for parent in RESOURCE_PIPELINES[name]["parents"]), default=0)
+
+    return sorted(names, key=depth)
+
+def get_data(pipelines: list[str] | None = None) -> dict[str, dict[str, float]]:
+    """
+    Run the resource pipelines concurrently, at most MAX_CONCURRENT_PIPELINES at a time,
+    starting the pipelines referenced by others first.
+    Args:
+        pipelines: the names of the pipelines to run, defaults to all of RESOURCE_PIPELINES.
+    Returns:
+        the stage timings of each pipeline that completed, keyed by the pipeline name.
+    """
+    names = pipeline_run_order(pipelines or list(RESOURCE_PIPELINES))
+    create_output_folders()
+    reference_index.start(names)
+    if EXTRACTION_ENGINE == "async":
+        return asyncio.run(async_get_data(names))
+
+    timings: dict[str, dict[str, float]] = {}
+    load_jobs: dict[str, bigquery.LoadJob] | None = {} if BQ_LOAD_MODE == "gcs" else None
+    started = time.perf_counter()
+
+    pool = cleaning_pool()
+    if pool and pool.backend == "process":
+        # fork the workers now, before the pipeline threads start
+        pool.submit(int).result()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PIPELINES) as pipeline_executor:
+            futures = {pipeline_executor.submit(run_resource_pipeline, name, load_jobs): name for name in names}
+            for future, name in futures.items():
+                # a pipeline that failed before the end of its extraction must not hold up the ones waiting for it
+                future.add_done_callback(lambda _, name=name: reference_index.done(name))
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    timings[name] = future.result()
+                except Exception as e:
+                    LOGGER.error("[get_data] Pipeline %s failed: %s", name, e)
+    finally:
+        shutdown_cleaning_pool()
+
+    if load_jobs is not None:
+        finish_load_jobs(load_jobs, timings)
+
+    attachment_index.save()
+    body_index.save()
+    report_run(names, timings, time.perf_counter() - started)
+    return timings
+
+async def async_iter_api_pages(session: "aiohttp.ClientSession", resource_type: str, request_slots: asyncio.Semaphore,
+                              since: str | None = None, cursor: str = "",
+                              on_page_done: Callable[[str], None] | None = None) -> AsyncIterator[list[dict[str, Any]]]:
+    """
+    Page through a Confluence API resource on the event loop, yielding the results of each page as it arrives.
+    In space pagination mode, resources with a per-space endpoint are paged through every space at once,
+    unless a cursor left by an earlier serial run is being resumed; see iter_space_pages for their cursors.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        resource_type: the type of resource to get
+        request_slots: the semaphore bounding the number of requests in flight.
+        since: ISO timestamp of the oldest modification to fetch, defaults to the start of yesterday
+        cursor: the cursor of the page to start from, empty to start from the first page
+        on_page_done: called with the cursor of the next page once the consumer is done with a page
+    Yields:
+        the records of one page of results
+    """
+    params = api_request_params(resource_type, since)
+    raw_url = RESOURCE_TYPES.get(resource_type)
+    if not raw_url:
+        LOGGER.error("unknown recource type passed")
+        return
+
+    if PAGINATION_MODE == "space" and resource_type in SPACE_RESOURCE_TYPES and not cursor:
+        async for page in async_iter_space_pages(session, resource_type, params, request_slots):
+            yield page
+        if on_page_done:
+            on_page_done("")
+        return
+
+    async for page in async_iter_cursor_pages(session, raw_url.format(url=os.getenv("BASE_URL")), params, resource_type,
+                                              request_slots, cursor, on_page_done):
+        yield page
+
+async def async_iter_cursor_pages(session: "aiohttp.ClientSession", url: str, params: dict[str, Any], resource_type: str,
+                                  request_slots: asyncio.Semaphore, cursor: str = "",
+                                  on_page_done: Callable[[str], None] | None = None,
+                                  conditional: bool = True) -> AsyncIterator[list[dict[str, Any]]]:
+    """
+    Follow the cursor chain of a Confluence API endpoint on the event loop, yielding the results of each page as it arrives.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        url: the url of the endpoint.
+        params: the query parameters of the first page, updated with the cursor of each page.
+        resource_type: the type of resource, used to attribute the metrics.
+        request_slots: the semaphore bounding the number of requests in flight.
+        cursor: the cursor of the page to start from, empty to start from the first page
+        on_page_done: called with the cursor of the next page once the consumer is done with a page
+        conditional: whether the pages are requested conditionally through the response cache
+    Yields:
+        the records of one page of results
+    """
+    next_cursor = cursor
+    while True:
+        if next_cursor:
+            params["cursor"] = next_cursor
+        payload = await async_get_api_page(session, url, params, resource_type, request_slots, conditional)
+        yield payload.get("results", [])
+
+        next_cursor = next_page_cursor(payload)
+        if on_page_done:
+            on_page_done(next_cursor)
+        if not next_cursor:
+            break
+
+async def async_list_space_ids(session: "aiohttp.ClientSession", request_slots: asyncio.Semaphore) -> list[str]:
+    """
+    List the ids of every space of the site on the event loop, once per run.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        request_slots: the semaphore bounding the number of requests in flight.
+    Returns:
+        the space ids.
+    """
+    global _space_ids
+    # the pipelines paging through spaces at the same time wait for the first one to list them
+    async with _async_space_ids_lock:
+        if _space_ids is None:
+            url = RESOURCE_TYPES["spaces"].format(url=os.getenv("BASE_URL"))
+            space_ids = []
+            # the listing shares the request of the spaces pipeline's first page, it never uses the pipeline's cache
+            async for page in async_iter_cursor_pages(session, url, {"limit": 250}, "spaces", request_slots, conditional=False):
+                reference_index.add("spaces", page)
+                space_ids.extend(space["id"] for space in page)
+            # only a complete list is kept, a failed listing is tried again by the next pipeline
+            _space_ids = space_ids
+            LOGGER.info("[async_list_space_ids] Found %d spaces", len(_space_ids))
+    return _space_ids
+
+async def async_iter_space_pages(session: "aiohttp.ClientSession", resource_type: str, params: dict[str, Any],
+                                 request_slots: asyncio.Semaphore) -> AsyncIterator[list[dict[str, Any]]]:
+    """
+    Page through the per-space endpoint of a resource type for every space on the event loop, SPACE_FANOUT_WORKERS
+    spaces at a time, yielding the pages of all spaces as they arrive. See iter_space_pages.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        resource_type: the type of resource, a key of SPACE_RESOURCE_TYPES.
+        params: the query parameters of the first page of each space.
+        request_slots: the semaphore bounding the number of requests in flight.
+    Yields:
+        the records of one page of results, from any space.
+    """
+    pages: asyncio.Queue = asyncio.Queue(maxsize=SPACE_FANOUT_WORKERS * 2)
+    space_slots = asyncio.Semaphore(SPACE_FANOUT_WORKERS)
 
-def get_data() -> None:
-    spaces = make_api_request("spaces")
-    LOGGER.info("Fetched %d spaces", len(spaces))
-    if spaces:
-        spaces = clean_data(spaces)
-        spaces_path = write_jsonl_file(spaces, "spaces")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.spaces", spaces_table_schema, spaces_path)
-
-    blogposts = make_api_request("blogposts")
-    LOGGER.info("Fetched %d blogposts", len(blogposts))
-    if blogposts:
-        blogposts = clean_data(blogposts)
-        blogposts_path = write_jsonl_file(blogposts, "blogposts")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.blogposts", blogposts_table_schema, blogposts_path)
-
-    tasks = make_api_request("tasks")
-    LOGGER.info("Fetched %d tasks", len(tasks))
-    if tasks:
-        tasks = clean_data(tasks)
-        tasks_path = write_jsonl_file(tasks, "tasks")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.tasks", tasks_table_schema, tasks_path)
-
-    pages = make_api_request("pages")
-    LOGGER.info("Fetched %d pages", len(pages))
-    if pages:
-        pages = clean_data(pages)
-        pages_path = write_jsonl_file(pages, "pages")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.pages", pages_table_schema, pages_path)
-
-    all_comments = make_api_request("footer-comments") + make_api_request("inline-comments")
-    LOGGER.info("Fetched %d comments", len(all_comments))
-    if all_comments:
-        all_comments = clean_data(all_comments)
-        all_commnents_path = write_jsonl_file(all_comments, "comments")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.comments", comments_table_schema, all_commnents_path)
-
-    attachments = make_api_request("attachments")
-    LOGGER.info("Fetched %d attachments", len(attachments))
-    if attachments:
-        attachments = clean_data(attachments, category="attachments")
-        attachments_path = write_jsonl_file(attachments, "attachments")
-        write_table_to_bq(f"{os.getenv("PROJECT_NAME")}.{os.getenv("DATASET")}.attachments", attachments_table_schema, attachments_path)
+    async def space_worker(space_id: str) -> None:
+        url = SPACE_RESOURCE_TYPES[resource_type].format(url=os.getenv("BASE_URL"), space_id=space_id)
+        async with space_slots:
+            try:
+                async for page in async_iter_cursor_pages(session, url, dict(params), resource_type, request_slots):
+                    await pages.put(page)
+                await pages.put(_QUEUE_DONE)
+            except Exception as e:
+                await pages.put(e)
 
+    space_ids = await async_list_space_ids(session, request_slots)
+    workers = [asyncio.create_task(space_worker(space_id)) for space_id in space_ids]
+    try:
+        remaining = len(workers)
+        while remaining:
+            page = await pages.get()
+            if page is _QUEUE_DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+async def async_get_api_page(session: "aiohttp.ClientSession", url: str, params: dict[str, Any], resource_type: str,
+                             request_slots: asyncio.Semaphore, conditional: bool = True) -> dict[str, Any]:
+    """
+    Request one page of a Confluence API resource on the event loop, retrying just this request when it fails.
+    Same retry, throttling and caching rules as get_api_page.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        url: the url of the resource.
+        params: the query parameters of the page.
+        resource_type: the type of resource, used to attribute the metrics.
+        request_slots: the semaphore bounding the number of requests in flight.
+        conditional: whether to send the validators of the cached page and replay its body when it is not modified.
+    Returns:
+        the decoded JSON body of the page.
+    """
+    import aiohttp
+
+    rate_limiter = host_rate_limiter(url)
+    validators, cached_page = await asyncio.to_thread(response_cache.page_validators, url, params) if conditional else ({}, None)
+    with run_metrics.span("api_page", resource_type) as span:
+        for attempt in range(1, API_MAX_ATTEMPTS + 1):
+            retry_after = None
+            await asyncio.sleep(rate_limiter.reserve())
+            try:
+                async with request_slots:
+                    async with session.get(url, params=params, headers={"Accept": "application/json", **validators}) as response:
+                        record_api_metrics(resource_type, requests=1)
+                        if response.status == 304:
+                            rate_limiter.on_success()
+                            record_api_metrics(resource_type, not_modified=1)
+                            return not_modified_page(url, cached_page)
+                        if response.status in (429, 503):
+                            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                            rate_limiter.on_throttle(retry_after)
+                            record_api_metrics(resource_type, throttled=1)
+                        response.raise_for_status()
+                        payload = await response.json()
+                        body = await response.read()
+                        span["bytes"] = len(body)
+                        if conditional:
+                            await asyncio.to_thread(response_cache.record_page, url, params, response.headers.get("ETag"),
+                                                    response.headers.get("Last-Modified"), body)
+                rate_limiter.on_success()
+                span["records"] = len(payload.get("results", []))
+                return payload
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                status = getattr(e, "status", None)
+                if attempt == API_MAX_ATTEMPTS or (status is not None and status < 500 and status != 429):
+                    raise
+                delay = retry_delay(attempt, retry_after)
+                LOGGER.warning("[async_get_api_page] Attempt %d for %s failed, retrying in %.1fs: %s", attempt, resource_type, delay, e)
+                record_api_metrics(resource_type, retries=1, retry_wait_seconds=delay)
+                span["retries"] += 1
+                if retry_after is None:
+                    # otherwise the rate limiter holds the next request until the Retry-After expires
+                    await asyncio.sleep(delay)
+
+async def async_download_confluence_file(session: "aiohttp.ClientSession", file_url: str, save_dir: str, request_slots: asyncio.Semaphore) -> str:
+    """
+    Download a file from Confluence on the event loop.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        file_url: the url of the file to download
+        save_dir: directory where the file should be saved
+        request_slots: the semaphore bounding the number of requests in flight.
+    Returns:
+        path to where the file has been saved, or an empty string if the download failed
+    """
+    import aiohttp
+
+    save_path = ""
+    download_url = os.getenv("BASE_URL").removesuffix("api/v2/") + file_url.removeprefix("/")
+    try:
+        async with request_slots:
+            async with session.get(download_url) as response:
+                response.raise_for_status()
+
+                filename = file_url.split("/")[-1].split("?")[0]
+                if not filename:
+                    content_type = response.headers.get("content-type", "").split(";")[0]
+                    ext = mimetypes.guess_extension(content_type) or ""
+                    filename = f"confluence_file{ext}"
+
+                with _save_path_lock:
+                    save_path = get_next_filename(os.path.join(save_dir, filename))
+                    open(save_path, "wb").close()
+
+                with open(save_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(65536):
+                        f.write(chunk)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        LOGGER.error("[async_download_confluence_file] Error: %s", e)
+        discard_partial_download(save_path)
+        return ""
+    except BaseException:
+        discard_partial_download(save_path)
+        raise
+    return save_path
+
+async def async_process_attachment(session: "aiohttp.ClientSession", item: dict[str, Any], save_dir: str,
+                                   request_slots: asyncio.Semaphore, upload_slots: asyncio.Semaphore) -> None:
+    """
+    Download an attachment, upload it to GCS and add the link to the GCS file to the record.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        item: the cleaned attachment record, updated in place.
+        save_dir: directory where the file should be saved
+        request_slots: the semaphore bounding the number of requests in flight.
+        upload_slots: the semaphore bounding the number of GCS uploads running at the same time.
+    """
+    with run_metrics.span("attachment_download") as span:
+        file_path = await async_download_confluence_file(session, item["downloadLink"], save_dir, request_slots)
+        span["bytes"] = os.path.getsize(file_path) if file_path else 0
+    if not file_path:
+        LOGGER.error("[async_process_attachment] ✗ File download failed")
+        return
+
+    with run_metrics.span("attachment_verify"):
+        verified = verify_file_content(file_path)
+    if not verified:
+        LOGGER.warning("[async_process_attachment] ⚠ File may be corrupted or in unexpected format")
+
+    async with upload_slots:
+        item["gcsLink"] = await asyncio.to_thread(gcs_add_file, file_path, object_name=attachment_object_name(item, file_path))
+
+async def async_run_resource_pipeline(session: "aiohttp.ClientSession", name: str, request_slots: asyncio.Semaphore,
+                                      upload_slots: asyncio.Semaphore, load_jobs: dict[str, bigquery.LoadJob] | None = None) -> dict[str, float]:
+    """
+    Fetch, clean, write and load a single resource pipeline on the event loop.
+    Each page is cleaned and appended to the staging file as it arrives and the attachments of a page
+    are downloaded and uploaded concurrently. The engine always streams pages, whatever EXTRACTION_MODE,
+    downloads attachments to disk before uploading them, whatever ATTACHMENT_TRANSFER_MODE, and only checkpoints the
+    page cursors of staging parts (STAGING_PART_SIZE): otherwise a failed run fetches its window again from the first page.
+    Args:
+        session: the aiohttp session authenticated against Confluence.
+        name: the key of the pipeline in RESOURCE_PIPELINES, also used as the table name.
+        request_slots: the semaphore bounding the number of requests in flight.
+        upload_slots: the semaphore bounding the number of GCS uploads running at the same time.
+        load_jobs: when given, the staging file is loaded from GCS and the running load job is added to it
+            instead of being waited for, see run_resource_pipeline.
+    Returns:
+        the time in seconds spent in each stage of the pipeline.
+    """
+    pipeline = RESOURCE_PIPELINES[name]
+    timings: dict[str, float] = {}
+    save_dir = tmp_outpath + "/attachments"
+    os.makedirs(save_dir, exist_ok=True)
+    written = 0
+
+    started = time.perf_counter()
+    # the sink checks its table and the checkpoints and indexes may read their state from GCS: they run on a thread
+    # so the requests in flight keep going
+    sink = await asyncio.to_thread(open_record_sink, name)
+    loader: PartLoader | None = None
+    if STAGING_PART_SIZE and not sink:
+        loader, writer = await asyncio.to_thread(start_spooling, name)
+    else:
+        writer = open_staging_writer(name, pipeline["schema"])
+        file_path = writer.file_path
+    try:
+        for resource_type in pipeline["resources"]:
+            checkpoint = await asyncio.to_thread(checkpoint_store.begin, resource_type)
+            if loader and checkpoint["done"]:
+                continue
+            # only the cursors of spooled parts are checkpointed, a single staging file is written again from the first page
+            pages = async_iter_api_pages(session, resource_type, request_slots, checkpoint["since"],
+                                         checkpoint["cursor"] if loader else "",
+                                         (lambda cursor, resource_type=resource_type: writer.mark_page(resource_type, cursor)) if loader else None)
+            async for page in pages:
+                if loader:
+                    loader.raise_if_failed()
+                reference_index.add(name, page)
+                # the cache lookup and the cleaning block, they run on a thread so the requests in flight keep going
+                page = await asyncio.to_thread(response_cache.changed, name, page)
+                keys = [attachment_index_key(item) for item in page]
+                records = await asyncio.to_thread(process_data, page, pipeline["schema"])
+                if pipeline["category"] == "attachments":
+                    gcs_links = await asyncio.to_thread(
+                        lambda: [attachment_index.lookup(key, item.get("fileId")) for item, key in zip(records, keys)])
+                    for item, gcs_link in zip(records, gcs_links):
+                        if gcs_link:
+                            item["gcsLink"] = gcs_link
+                    await asyncio.gather(*(
+                        async_process_attachment(session, item, save_dir, request_slots, upload_slots)
+                        for item in records if "downloadLink" in item and "gcsLink" not in item
+                    ))
+                    for item, key in zip(records, keys):
+                        if item.get("gcsLink"):
+                            attachment_index.record(key, item.get("fileId"), item["gcsLink"])
+                else:
+                    await asyncio.to_thread(offload_bodies, records, name)
+                # waits on a thread until the parent pipelines are done extracting
+                await asyncio.to_thread(reference_index.enrich, name, records)
+                with run_metrics.span("staging_write", name) as span:
+                    span["records"] = await asyncio.to_thread(writer.write, records)
+                written += span["records"]
+                if sink:
+                    await asyncio.to_thread(sink.append, records)
+    finally:
+        reference_index.done(name)
+        await asyncio.to_thread(writer.close)
+        if loader:
+            await asyncio.to_thread(loader.wait)
+        if sink:
+            await asyncio.to_thread(sink.close)
+    timings["extract"] = time.perf_counter() - started
+    LOGGER.info("Fetched %d %s", written, name)
+
+    if loader:
+        started = time.perf_counter()
+        loaded = await asyncio.to_thread(loader.finish, load_jobs)
+        timings["load"] = time.perf_counter() - started
+        if loaded and (load_jobs is None or name not in load_jobs):
+            await asyncio.to_thread(commit_pipeline_checkpoints, name)
+        return timings
+
+    loaded = True
+    if sink:
+        # the records already reached the table through the sink
+        written = 0
+
+    if written and load_jobs is not None:
+        started = time.perf_counter()
+        load_job = await asyncio.to_thread(submit_load_job, pipeline_table_id(name), pipeline["schema"], file_path)
+        timings["stage"] = time.perf_counter() - started
+        if load_job:
+            load_jobs[name] = load_job
+        return timings
+
+    if written:
+        started = time.perf_counter()
+        loaded = await asyncio.to_thread(write_table_to_bq, pipeline_table_id(name), pipeline["schema"], file_path)
+        timings["load"] = time.perf_counter() - started
+    else:
+        os.remove(file_path)
+
+    if loaded:
+        await asyncio.to_thread(commit_pipeline_checkpoints, name)
+
+    return timings
+
+async def async_get_data(names: list[str]) -> dict[str, dict[str, float]]:
+    """
+    Run the resource pipelines as coroutines sharing one aiohttp session, with at most
+    ASYNC_MAX_REQUESTS Confluence requests and ASYNC_MAX_UPLOADS GCS uploads in flight.
+    Args:
+        names: the names of the pipelines to run.
+    Returns:
+        the stage timings of each pipeline that completed, keyed by the pipeline name.
+    """
+    try:
+        import aiohttp
+    except ImportError as e:
+        raise RuntimeError("EXTRACTION_ENGINE=async requires the aiohttp package") from e
+
+    global _async_space_ids_lock
+    request_slots = asyncio.Semaphore(ASYNC_MAX_REQUESTS)
+    upload_slots = asyncio.Semaphore(ASYNC_MAX_UPLOADS)
+    _async_space_ids_lock = asyncio.Lock()
+    # blocking GCS uploads and BigQuery loads run on this executor, sized to the upload limit
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=ASYNC_MAX_UPLOADS + len(names)))
+
+    timings: dict[str, dict[str, float]] = {}
+    load_jobs: dict[str, bigquery.LoadJob] | None = {} if BQ_LOAD_MODE == "gcs" else None
+    started = time.perf_counter()
+    async def run_pipeline(session: "aiohttp.ClientSession", name: str) -> dict[str, float]:
+        try:
+            return await async_run_resource_pipeline(session, name, request_slots, upload_slots, load_jobs)
+        finally:
+            # a pipeline that failed before the end of its extraction must not hold up the ones waiting for it
+            reference_index.done(name)
+
+    async with aiohttp.ClientSession(
+        auth=aiohttp.BasicAuth(os.getenv("EMAIL"), os.getenv("API_TOKEN")),
+        connector=aiohttp.TCPConnector(limit=ASYNC_MAX_REQUESTS),
+        timeout=aiohttp.ClientTimeout(sock_connect=15, sock_read=15),
+    ) as session:
+        results = await asyncio.gather(*(run_pipeline(session, name) for name in names), return_exceptions=True)
+
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            LOGGER.error("[async_get_data] Pipeline %s failed: %s", name, result)
+        else:
+            timings[name] = result
+
+    if load_jobs is not None:
+        await asyncio.to_thread(finish_load_jobs, load_jobs, timings)
+
+    attachment_index.save()
+    body_index.save()
+    report_run(names, timings, time.perf_counter() - started)
+    return timings
 
 def clean_up(directory: str) -> None:
     """Delete data downloaded during execution"""
@@ -602,6 +3952,25 @@ def clean_up(directory: str) -> None:
         except OSError as e:
             LOGGER.error("[clean_up] Error deleting directory: %s", e)
 
+def main(argv: list[str] | None = None) -> None:
+    """
+    Command line entry point: run the selected pipelines, then delete the temporary output folder.
+    Args:
+        argv: the command line arguments, defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Extract Confluence resources into BigQuery and Cloud Storage.")
+    parser.add_argument("pipelines", nargs="*", metavar="pipeline",
+                        help=f"pipelines to run, all of them by default: {", ".join(RESOURCE_PIPELINES)}")
+    parser.add_argument("--keep-files", action="store_true", help="keep the temporary output folder after the run")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.pipelines if name not in RESOURCE_PIPELINES]
+    if unknown:
+        parser.error(f"unknown pipelines: {", ".join(unknown)}")
+
+    configure_cloud_logging()
+    get_data(args.pipelines or None)
+    if not args.keep_files:
+        clean_up(downloads_folder)
+
 if __name__ == "__main__":
-    get_data()
-    clean_up(downloads_folder)
+    main()
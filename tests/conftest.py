@@ -0,0 +1,7 @@
+"""
+Shared setup of the tests: the extraction is imported from src/app, the way the container runs it.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "app"))
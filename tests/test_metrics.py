@@ -0,0 +1,18 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("values, pct, expected", [
+    ([], 50, 0.0),
+    ([7.0], 95, 7.0),
+    ([1, 2, 3, 4, 5], 50, 3),
+    ([5, 1, 4, 2, 3], 50, 3),
+    ([1, 2, 3, 4], 50, 2),
+    (list(range(1, 31)), 95, 29),
+    (list(range(1, 101)), 95, 95),
+    (list(range(1, 101)), 100, 100),
+    ([1, 2, 3], 0, 1),
+])
+def test_percentile_uses_the_nearest_rank(values, pct, expected):
+    assert main.percentile(values, pct) == expected
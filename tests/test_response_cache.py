@@ -0,0 +1,80 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+import main
+
+URL = "https://example.atlassian.net/wiki/api/v2/spaces"
+PAGE = {"results": [{"id": "1", "key": "ENG"}, {"id": "2", "key": "OPS"}], "_links": {"next": "/wiki/api/v2/spaces?cursor=Mg==&limit=250"}}
+
+
+class FakeSession:
+    """Answers every request with the next of the given responses and keeps the headers sent."""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.sent_headers.append(headers)
+        return self.responses.pop(0)
+
+
+def response(status_code, payload=None, headers=None):
+    content = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    return SimpleNamespace(status_code=status_code, headers=headers or {}, content=content,
+                           json=lambda: json.loads(content), raise_for_status=lambda: None)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = main.ResponseCache(str(tmp_path / "cache.db"), 100)
+    monkeypatch.setattr(main, "response_cache", cache)
+    return cache
+
+
+def test_request_key_ignores_the_window():
+    first = main.ResponseCache.request_key(URL, {"limit": 250, "cql": 'lastmodified >= "2024/01/01 00:00"', "cursor": "Mg=="})
+    second = main.ResponseCache.request_key(URL, {"cursor": "Mg==", "limit": 250, "cql": 'lastmodified >= "2024/01/02 00:00"'})
+    assert first == second
+    assert first != main.ResponseCache.request_key(URL, {"limit": 250, "cursor": "NA=="})
+
+
+def test_recorded_page_is_requested_conditionally_and_replayed(cache):
+    cache.record_page(URL, {"limit": 250}, '"abc"', None, json.dumps(PAGE).encode("utf-8"))
+
+    headers, cached_page = cache.page_validators(URL, {"limit": 250, "cql": "lastmodified >= 2024/01/01"})
+    assert headers == {"If-None-Match": '"abc"'}
+    assert cached_page == PAGE
+
+
+def test_pages_cached_without_a_body_are_not_requested_conditionally(tmp_path):
+    location = str(tmp_path / "cache.db")
+    db = sqlite3.connect(location)
+    db.execute("CREATE TABLE pages (request TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, next_link TEXT NOT NULL, last_used REAL NOT NULL)")
+    db.execute("INSERT INTO pages VALUES (?, ?, ?, ?, ?)", (main.ResponseCache.request_key(URL, {"limit": 250}), '"abc"', None, "", 0.0))
+    db.commit()
+    db.close()
+
+    assert main.ResponseCache(location, 100).page_validators(URL, {"limit": 250}) == ({}, None)
+
+
+def test_not_modified_page_replays_the_cached_results(cache, monkeypatch):
+    session = FakeSession(response(200, PAGE, {"ETag": '"abc"'}), response(304, headers={"ETag": '"abc"'}))
+    monkeypatch.setattr(main, "get_http_session", lambda: session)
+
+    assert main.get_api_page(URL, {"limit": 250}, {"Accept": "application/json"}, "spaces") == PAGE
+    assert main.get_api_page(URL, {"limit": 250}, {"Accept": "application/json"}, "spaces") == PAGE
+    assert session.sent_headers[1]["If-None-Match"] == '"abc"'
+
+
+def test_unconditional_requests_skip_the_cache(cache, monkeypatch):
+    cache.record_page(URL, {"limit": 250}, '"abc"', None, json.dumps(PAGE).encode("utf-8"))
+    session = FakeSession(response(304))
+    monkeypatch.setattr(main, "get_http_session", lambda: session)
+
+    # a 304 is never read as an empty page, the pipeline would load nothing and still move its watermark
+    with pytest.raises(RuntimeError):
+        main.get_api_page(URL, {"limit": 250}, {"Accept": "application/json"}, "spaces", conditional=False)
+    assert "If-None-Match" not in session.sent_headers[0]
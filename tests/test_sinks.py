@@ -0,0 +1,83 @@
+import pytest
+from google.cloud import bigquery
+
+import main
+
+SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("title", "STRING"),
+    bigquery.SchemaField("version", "STRING"),
+]
+
+
+@pytest.fixture
+def memory_batches(monkeypatch):
+    batches: dict[str, list[list[dict]]] = {}
+    monkeypatch.setattr(main.InMemorySink, "batches", batches)
+    return batches
+
+
+def test_record_sink_requires_send_batch():
+    with pytest.raises(TypeError):
+        main.RecordSink("p.d.pages", SCHEMA)
+
+
+def test_in_memory_sink_appends_batches_of_schema_columns(monkeypatch, memory_batches):
+    monkeypatch.setattr(main, "BQ_SINK_BATCH_SIZE", 2)
+    sink = main.InMemorySink("p.d.pages", SCHEMA)
+
+    sink.append([
+        {"id": "1", "title": "a", "version": {"number": 1}, "extra": "dropped"},
+        {"id": "2", "title": None},
+        {"id": "3", "title": "c"},
+    ])
+    assert memory_batches["p.d.pages"] == [[
+        {"id": "1", "title": "a", "version": '{"number":1}'},
+        {"id": "2", "title": None, "version": None},
+    ]]
+
+    sink.close()
+    assert memory_batches["p.d.pages"][1] == [{"id": "3", "title": "c", "version": None}]
+    assert sink.appended == 3
+
+
+PAGE = {
+    "id": "42",
+    "status": "current",
+    "title": "Release notes",
+    "spaceId": "7",
+    "version": {"number": 3, "createdAt": "2024-01-01T00:00:00.000Z"},
+    "bodySha256": "ab" * 32,
+    "bodySize": 42,
+    "bodyUri": "gs://bench/confluence_bodies/abab.json.gz",
+}
+
+
+def test_sink_rows_keep_non_string_columns(memory_batches):
+    sink = main.InMemorySink("p.d.pages", main.pages_table_schema)
+    sink.append([PAGE])
+    sink.close()
+
+    row = memory_batches["p.d.pages"][0][0]
+    assert row["bodySize"] == 42
+    assert row["version"] == '{"number":3,"createdAt":"2024-01-01T00:00:00.000Z"}'
+    assert row["parentId"] is None
+
+
+def test_page_row_round_trips_through_storage_write_proto(memory_batches):
+    pytest.importorskip("google.protobuf")
+    sink = main.InMemorySink("p.d.pages", main.pages_table_schema)
+    sink.append([PAGE])
+    sink.close()
+    row = memory_batches["p.d.pages"][0][0]
+
+    row_class = main.StorageWriteSink.row_class(main.pages_table_schema)
+    message = row_class.FromString(main.StorageWriteSink.serialize_row(row_class, row))
+
+    assert message.bodySize == 42
+    assert message.id == "42"
+    assert message.version == row["version"]
+    assert not message.HasField("parentId")
+    assert {field.name: value for field, value in message.ListFields()} == {
+        key: value for key, value in row.items() if value is not None
+    }